@@ -8,6 +8,7 @@ from collections import defaultdict
 from torchvision.utils import save_image
 from config import args, DirsAndLocksSingleton
 from model_ddpg import DuelNet, PiNet, SplineNet, MultipleOptimizer
+from replay import ReplayBuffer
 import math
 import os
 import copy
@@ -19,8 +20,9 @@ class Agent(object):
         self.cuda_id = args.cuda_default
         use_cuda = not args.no_cuda and torch.cuda.is_available()
         self.device = torch.device("cuda" if use_cuda else "cpu")
-        self.action_space = args.action_space
         self.env = env
+        # taken from the problem and not from args, the models are built for whatever dimension it has
+        self.action_space = len(env.get_initial_solution())
         self.dirs_locks = DirsAndLocksSingleton(exp_name)
 
         self.use_trust_region = args.trust_region
@@ -31,7 +33,9 @@ class Agent(object):
         self.problem_index = env.problem_iter
         self.value_lr = args.value_lr
         self.budget = args.budget
-        self.checkpoint = checkpoint
+        # one checkpoint per problem, so a preempted sweep resumes each problem from its own state
+        self.checkpoint = '{}_{}'.format(checkpoint, self.problem_index)
+        self.resumed = args.load_last_model and os.path.exists(self.checkpoint)
         self.algorithm_method = args.algorithm
         self.grad_clip = args.grad_clip
         self.req_lambda = 1e-3
@@ -39,17 +43,20 @@ class Agent(object):
         self.best_explore_update = args.best_explore_update
         self.printing_interval = args.printing_interval
         self.analysis_dir = os.path.join(self.dirs_locks.analysis_dir, str(self.problem_index))
-        if os.path.exists(self.analysis_dir):
+        if self.resumed:
+            os.makedirs(self.analysis_dir, exist_ok=True)
+        elif os.path.exists(self.analysis_dir):
             shutil.rmtree(self.analysis_dir, ignore_errors=True)
             os.makedirs(self.analysis_dir)
         else:
             os.makedirs(self.analysis_dir)
+        # every evaluation is streamed to disk as it happens, see environment.load_trace
+        self.env.trace.open(os.path.join(self.analysis_dir, 'trace.bin'))
 
         self.frame = 0
         self.n_offset = 0
         self.results = defaultdict(list)
-        self.tensor_replay_reward = torch.cuda.FloatTensor([])
-        self.tensor_replay_policy = torch.cuda.FloatTensor([])
+        self.replay = ReplayBuffer(self.replay_memory_size, self.action_space, self.device)
         self.pi_lr = args.pi_lr
         self.epsilon = args.epsilon * math.sqrt(self.action_space)
         self.delta = self.pi_lr
@@ -81,14 +88,14 @@ class Agent(object):
         self.value_iter = args.learn_iteration
         if self.algorithm_method in ['EGL']:
             if self.spline:
-                self.derivative_net = SplineNet(self.device, self.pi_net, output=self.action_space)
+                self.derivative_net = SplineNet(self.device, self.pi_net, self.action_space, output=self.action_space)
                 self.derivative_net.to(self.device)
                 # IT IS IMPORTANT TO ASSIGN MODEL TO CUDA/PARALLEL BEFORE DEFINING OPTIMIZER
                 opt_sparse = torch.optim.SparseAdam(self.derivative_net.embedding.parameters(), lr=0.1, betas=(0.9, 0.999), eps=1e-04)
                 opt_dense = torch.optim.Adam(self.derivative_net.head.parameters(), lr=0.001, betas=(0.9, 0.999), eps=1e-04)
                 self.optimizer_derivative = MultipleOptimizer(opt_sparse, opt_dense)
             else:
-                self.derivative_net = DuelNet(self.pi_net, self.action_space)
+                self.derivative_net = DuelNet(self.pi_net, self.action_space, self.action_space)
                 self.derivative_net.to(self.device)
                 # IT IS IMPORTANT TO ASSIGN MODEL TO CUDA/PARALLEL BEFORE DEFINING OPTIMIZER
                 self.optimizer_derivative = torch.optim.Adam(self.derivative_net.parameters(), lr=self.value_lr, eps=1.5e-4, weight_decay=0)
@@ -96,14 +103,14 @@ class Agent(object):
             self.derivative_net_zero = copy.deepcopy(self.derivative_net.state_dict())
         elif self.algorithm_method == 'IGL':
             if self.spline:
-                self.value_net = SplineNet(self.device, self.pi_net, output=1)
+                self.value_net = SplineNet(self.device, self.pi_net, self.action_space, output=1)
                 self.value_net.to(self.device)
                 # IT IS IMPORTANT TO ASSIGN MODEL TO CUDA/PARALLEL BEFORE DEFINING OPTIMIZER
                 opt_sparse = torch.optim.SparseAdam(self.value_net.embedding.parameters(), lr=0.1, betas=(0.9, 0.999), eps=1e-04)
                 opt_dense = torch.optim.Adam(self.value_net.head.parameters(), lr=0.001, betas=(0.9, 0.999), eps=1e-04)
                 self.optimizer_value = MultipleOptimizer(opt_sparse, opt_dense)
             else:
-                self.value_net = DuelNet(self.pi_net, 1)
+                self.value_net = DuelNet(self.pi_net, self.action_space, 1)
                 self.value_net.to(self.device)
                 # IT IS IMPORTANT TO ASSIGN MODEL TO CUDA/PARALLEL BEFORE DEFINING OPTIMIZER
                 self.optimizer_value = torch.optim.Adam(self.value_net.parameters(), lr=self.value_lr, eps=1.5e-4, weight_decay=0)
@@ -157,10 +164,6 @@ class Agent(object):
                     assert False, "save_results"
                 np.save(path, tmp)
 
-        best_list, observed_list, _ = self.env.get_observed_and_pi_list()
-        np.save(os.path.join(self.analysis_dir, 'best_list_with_explore.npy'), np.array(best_list))
-        np.save(os.path.join(self.analysis_dir, 'observed_list_with_explore.npy'), np.array(best_list))
-
         path = os.path.join(self.analysis_dir, 'f0.npy')
         np.save(path, self.env.get_f0())
 
@@ -174,23 +177,37 @@ class Agent(object):
                      'derivative_net': self.derivative_net.state_dict(),
                      'optimizer_derivative': self.optimizer_derivative.state_dict(),
                      'optimizer_pi': self.optimizer_pi.state_dict(),
+                     'env': self.env.snapshot(cache=args.checkpoint_cache),
+                     'rng': self.rng_state(),
                      'aux': aux}
         elif self.algorithm_method == 'IGL':
             state = {'pi_net': self.pi_net.pi.detach(),
                      'value_net': self.value_net.state_dict(),
                      'optimizer_value': self.optimizer_value.state_dict(),
                      'optimizer_pi': self.optimizer_pi.state_dict(),
+                     'env': self.env.snapshot(cache=args.checkpoint_cache),
+                     'rng': self.rng_state(),
                      'aux': aux}
         else:
             raise NotImplementedError
 
         torch.save(state, path)
 
+    def rng_state(self):
+        return {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(),
+                'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+
+    def set_rng_state(self, state):
+        torch.set_rng_state(state['torch'])
+        np.random.set_state(state['numpy'])
+        if state['cuda'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(state['cuda'])
+
     def load_checkpoint(self, path):
         if not os.path.exists(path):
             assert False, "load_checkpoint"
-        state = torch.load(path, map_location="cuda:%d" % self.cuda_id)
-        self.pi_net = state['pi_net'].to(self.device)
+        state = torch.load(path, map_location=self.device)
+        self.pi_net.pi_update(state['pi_net'].to(self.device))
         self.optimizer_pi.load_state_dict(state['optimizer_pi'])
         if self.algorithm_method in ['EGL']:
             self.derivative_net.load_state_dict(state['derivative_net'])
@@ -201,6 +218,10 @@ class Agent(object):
         else:
             raise NotImplementedError
         self.n_offset = state['aux']['n']
+        if 'env' in state:
+            self.env.restore(state['env'])
+        if 'rng' in state:
+            self.set_rng_state(state['rng'])
 
         return state['aux']
 
@@ -229,14 +250,14 @@ class Agent(object):
     def exploration_rand(self, n_explore):
         pi = self.pi_net.pi.detach().clone()
         rand_sign = (2*torch.randint(0, 2 ,size=(n_explore-1, self.action_space), device=self.device)-1).reshape(n_explore-1, self.action_space)
-        pi_explore = pi - self.epsilon * rand_sign * torch.cuda.FloatTensor(n_explore-1, self.action_space).uniform_()
+        pi_explore = pi - self.epsilon * rand_sign * torch.rand(n_explore-1, self.action_space, device=self.device)
         return torch.cat([pi.unsqueeze(0), pi_explore], dim=0)
 
     def ball_explore_(self, pi, n_explore):
         pi = pi.unsqueeze(0)
 
-        x = torch.cuda.FloatTensor(n_explore, self.action_space).normal_()
-        mag = torch.cuda.FloatTensor(n_explore, 1).uniform_()
+        x = torch.randn(n_explore, self.action_space, device=self.device)
+        mag = torch.rand(n_explore, 1, device=self.device)
 
         x = x / (torch.norm(x, dim=1, keepdim=True) + 1e-8)
 
@@ -255,8 +276,8 @@ class Agent(object):
         alpha = math.pi/angle
         pi = pi.unsqueeze(0)
 
-        x = torch.cuda.FloatTensor(n_explore, self.action_space).normal_()
-        mag = torch.cuda.FloatTensor(n_explore, 1).uniform_()
+        x = torch.randn(n_explore, self.action_space, device=self.device)
+        mag = torch.rand(n_explore, 1, device=self.device)
 
         x = x / (torch.norm(x, dim=1, keepdim=True) + 1e-8)
         grad = grad / (torch.norm(grad) + 1e-8)
@@ -0,0 +1,638 @@
+import re
+import math
+import numpy as np
+from config import args
+
+try: import cocoex
+except: pass
+
+# instances of cocoex.Suite("bbob", "", ...) when no year/instances are given
+DEFAULT_INSTANCES = '1-5,71-80'
+
+
+# legacy bbob2009 random generators, reproduced bit for bit so that xopt, fopt and the
+# rotations match the instances generated by cocoex
+
+def unif(n, inseed):
+    inseed = abs(inseed)
+    if inseed < 1:
+        inseed = 1
+    aktseed = inseed
+    rgrand = [0] * 32
+    for i in range(39, -1, -1):
+        tmp = aktseed // 127773
+        aktseed = 16807 * (aktseed - tmp * 127773) - 2836 * tmp
+        if aktseed < 0:
+            aktseed = aktseed + 2147483647
+        if i < 32:
+            rgrand[i] = aktseed
+    aktrand = rgrand[0]
+
+    r = np.empty(n, dtype=np.float64)
+    for i in range(n):
+        tmp = aktseed // 127773
+        aktseed = 16807 * (aktseed - tmp * 127773) - 2836 * tmp
+        if aktseed < 0:
+            aktseed = aktseed + 2147483647
+        tmp = aktrand // 67108865
+        aktrand = rgrand[tmp]
+        rgrand[tmp] = aktseed
+        r[i] = aktrand / 2.147483647e9
+        if r[i] == 0.:
+            r[i] = 1e-99
+    return r
+
+
+def gauss(n, seed):
+    u = unif(2 * n, seed)
+    g = np.sqrt(-2 * np.log(u[:n])) * np.cos(2 * math.pi * u[n:])
+    g[g == 0.] = 1e-99
+    return g
+
+
+def compute_rotation(seed, dim):
+    g = gauss(dim * dim, seed)
+    b = [[g[j * dim + i] for j in range(dim)] for i in range(dim)]
+
+    # Gram-Schmidt on the columns, with the same summation order as the C code
+    for i in range(dim):
+        for j in range(i):
+            prod = 0.
+            for k in range(dim):
+                prod += b[k][i] * b[k][j]
+            for k in range(dim):
+                b[k][i] -= prod * b[k][j]
+        prod = 0.
+        for k in range(dim):
+            prod += b[k][i] * b[k][i]
+        for k in range(dim):
+            b[k][i] /= math.sqrt(prod)
+
+    return np.array(b)
+
+
+def compute_xopt(seed, dim):
+    xopt = unif(dim, seed)
+    xopt = 8 * np.floor(1e4 * xopt) / 1e4 - 4
+    xopt[xopt == 0.] = -1e-5
+    return xopt
+
+
+def compute_fopt(function, instance):
+    if function == 4:
+        rseed = 3
+    elif function == 18:
+        rseed = 17
+    else:
+        rseed = function
+
+    rrseed = rseed + 10000 * instance
+    gval = gauss(1, rrseed)[0]
+    gval2 = gauss(1, rrseed + 1)[0]
+    return min(1000., max(-1000., math.floor(100. * 100. * gval / gval2 + 0.5) / 100.))
+
+
+# vectorized transformations, all of them act on (N, D) batches
+
+def t_osz(x):
+    y = np.zeros_like(x)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        pos = x > 0
+        t = np.log(x[pos]) / 0.1
+        y[pos] = np.power(np.exp(t + 0.49 * (np.sin(t) + np.sin(0.79 * t))), 0.1)
+        neg = x < 0
+        t = np.log(-x[neg]) / 0.1
+        y[neg] = -np.power(np.exp(t + 0.49 * (np.sin(0.55 * t) + np.sin(0.31 * t))), 0.1)
+    return y
+
+
+def t_asy(x, beta):
+    dim = x.shape[1]
+    pos = x > 0
+    x_pos = np.where(pos, x, 1.)
+    exponent = 1.0 + (beta * np.arange(dim)) / (dim - 1.0) * np.sqrt(x_pos)
+    return np.where(pos, np.power(x_pos, exponent), x)
+
+
+def penalty(x):
+    return np.sum(np.maximum(np.abs(x) - 5., 0.) ** 2, axis=1)
+
+
+def linear_transform(rot1, rot2, base):
+    # rot1 * diag(base^(k / (D - 1))) * rot2
+    dim = len(rot1)
+    scales = np.power(base, np.arange(dim) / (dim - 1.0))
+    return (rot1 * scales) @ rot2
+
+
+def affine(x, m, b=0.):
+    return x @ m.T + b
+
+
+def round_half_up(x):
+    return np.floor(x + 0.5)
+
+
+# raw functions
+
+def f_sphere_raw(z):
+    return np.sum(z * z, axis=1)
+
+
+def f_ellipsoid_raw(z):
+    dim = z.shape[1]
+    return np.sum(np.power(1.0e6, np.arange(dim) / (dim - 1.0)) * z * z, axis=1)
+
+
+def f_rastrigin_raw(z):
+    dim = z.shape[1]
+    return 10.0 * (dim - np.sum(np.cos(2 * math.pi * z), axis=1)) + np.sum(z * z, axis=1)
+
+
+def f_rosenbrock_raw(z):
+    s1 = z[:, :-1] * z[:, :-1] - z[:, 1:]
+    s2 = z[:, :-1] - 1.0
+    return np.sum(100.0 * s1 * s1 + s2 * s2, axis=1)
+
+
+def f_discus_raw(z):
+    return 1.0e6 * z[:, 0] * z[:, 0] + np.sum(z[:, 1:] * z[:, 1:], axis=1)
+
+
+def f_bent_cigar_raw(z):
+    return z[:, 0] * z[:, 0] + 1.0e6 * np.sum(z[:, 1:] * z[:, 1:], axis=1)
+
+
+def f_sharp_ridge_raw(z):
+    return 100.0 * np.sqrt(np.sum(z[:, 1:] * z[:, 1:], axis=1)) + z[:, 0] * z[:, 0]
+
+
+def f_different_powers_raw(z):
+    dim = z.shape[1]
+    exponent = 2.0 + (4.0 * np.arange(dim)) / (dim - 1.0)
+    return np.sqrt(np.sum(np.power(np.abs(z), exponent), axis=1))
+
+
+def f_weierstrass_raw(z):
+    dim = z.shape[1]
+    ak = np.power(0.5, np.arange(12.))
+    bk = np.power(3., np.arange(12.))
+    f0 = 0.
+    for a, b in zip(ak, bk):
+        f0 += a * math.cos(2 * math.pi * b * 0.5)
+    result = np.sum(np.cos(2 * math.pi * (z[:, :, None] + 0.5) * bk) * ak, axis=(1, 2))
+    return 10.0 * np.power(result / dim - f0, 3.0)
+
+
+def f_schaffers_raw(z):
+    dim = z.shape[1]
+    tmp = z[:, :-1] * z[:, :-1] + z[:, 1:] * z[:, 1:]
+    result = np.sum(np.power(tmp, 0.25) * (1.0 + np.power(np.sin(50.0 * np.power(tmp, 0.1)), 2.0)), axis=1)
+    return np.power(result / (dim - 1.0), 2.0)
+
+
+def f_griewank_rosenbrock_raw(z):
+    dim = z.shape[1]
+    c1 = z[:, :-1] * z[:, :-1] - z[:, 1:]
+    c2 = 1.0 - z[:, :-1]
+    tmp = 100.0 * c1 * c1 + c2 * c2
+    return 10. + 10. * np.sum(tmp / 4000. - np.cos(tmp), axis=1) / (dim - 1)
+
+
+def f_schwefel_raw(z):
+    dim = z.shape[1]
+    pen = np.sum(np.maximum(np.abs(z) - 500.0, 0.) ** 2, axis=1)
+    s = np.sum(z * np.sin(np.sqrt(np.abs(z))), axis=1)
+    return 0.01 * (pen + 418.9828872724339 - s / dim)
+
+
+def f_katsuura_raw(z):
+    dim = z.shape[1]
+    p = np.power(2., np.arange(1., 33.))
+    zp = z[:, :, None] * p
+    tmp = np.sum(np.abs(zp - round_half_up(zp)) / p, axis=2)
+    tmp = 1.0 + (np.arange(dim) + 1.) * tmp
+    result = np.prod(tmp, axis=1)
+    return 10. / dim / dim * (-1. + np.power(result, 10. / np.power(dim, 1.2)))
+
+
+# bbob problems, one builder per function returning the vectorized objective and fopt
+
+def build_sphere(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    return lambda x: f_sphere_raw(x - xopt) + fopt, fopt
+
+
+def build_ellipsoid(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    return lambda x: f_ellipsoid_raw(t_osz(x - xopt)) + fopt, fopt
+
+
+def build_rastrigin(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    conditioning = np.power(10.0, 0.5 * np.arange(dim) / (dim - 1.0))
+    return lambda x: f_rastrigin_raw(conditioning * t_asy(t_osz(x - xopt), 0.2)) + fopt, fopt
+
+
+def build_bueche_rastrigin(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    # this step is in the legacy C code but not in the function description
+    xopt[::2] = np.abs(xopt[::2])
+    fopt = compute_fopt(function, instance)
+    factor = np.power(math.sqrt(10.0), np.arange(dim) / (dim - 1.0))
+    even = (np.arange(dim) % 2) == 0
+
+    def f(x):
+        z = t_osz(x - xopt)
+        z = np.where((z > 0.0) & even, 10.0 * factor, factor) * z
+        return f_rastrigin_raw(z) + fopt + 100.0 * penalty(x)
+    return f, fopt
+
+
+def build_linear_slope(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    best = np.where(xopt < 0.0, -5.0, 5.0)
+    si = np.power(math.sqrt(100.0), np.arange(dim) / (dim - 1.0))
+    si = np.where(best > 0.0, si, -si)
+
+    def f(x):
+        z = np.where(x * best < 25.0, x, best)
+        return np.sum(5.0 * np.abs(si) - si * z, axis=1) + fopt
+    return f, fopt
+
+
+def build_attractive_sector(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    m = linear_transform(compute_rotation(rseed + 1000000, dim), compute_rotation(rseed, dim), math.sqrt(10.0))
+
+    def f(x):
+        z = affine(x - xopt, m)
+        y = np.sum(np.where(xopt * z > 0.0, 100.0 * 100.0 * z * z, z * z), axis=1)
+        return np.power(t_osz(y[:, None])[:, 0], 0.9) + fopt
+    return f, fopt
+
+
+def build_step_ellipsoid(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed + 1000000, dim)
+    rot2 = compute_rotation(rseed, dim)
+    c1 = np.sqrt(np.power(100. / 10., np.arange(dim) / (dim - 1.0)))
+    condition = np.power(100., np.arange(dim) / (dim - 1.0))
+
+    def f(x):
+        pen = np.sum(np.maximum(np.abs(x) - 5.0, 0.) ** 2, axis=1)
+        z = c1 * affine(x - xopt, rot2)
+        x1 = z[:, 0]
+        z = np.where(np.abs(z) > 0.5, round_half_up(z), round_half_up(10.0 * z) / 10.0)
+        z = affine(z, rot1)
+        result = np.sum(condition * z * z, axis=1)
+        return 0.1 * np.maximum(np.abs(x1) * 1.0e-4, result) + pen + fopt
+    return f, fopt
+
+
+def build_rosenbrock(function, dim, instance, rseed):
+    xopt = 0.75 * compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    factor = max(1.0, math.sqrt(dim) / 8.0)
+    return lambda x: f_rosenbrock_raw(factor * (x - xopt) + 1.0) + fopt, fopt
+
+
+def build_rosenbrock_rotated(function, dim, instance, rseed):
+    fopt = compute_fopt(function, instance)
+    m = max(1.0, math.sqrt(dim) / 8.0) * compute_rotation(rseed, dim)
+    return lambda x: f_rosenbrock_raw(affine(x, m, 0.5)) + fopt, fopt
+
+
+def build_ellipsoid_rotated(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed, dim)
+    return lambda x: f_ellipsoid_raw(t_osz(affine(x - xopt, rot1))) + fopt, fopt
+
+
+def build_discus(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed, dim)
+    return lambda x: f_discus_raw(t_osz(affine(x - xopt, rot1))) + fopt, fopt
+
+
+def build_bent_cigar(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed + 1000000, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed + 1000000, dim)
+    return lambda x: f_bent_cigar_raw(affine(t_asy(affine(x - xopt, rot1), 0.5), rot1)) + fopt, fopt
+
+
+def build_sharp_ridge(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    m = linear_transform(compute_rotation(rseed + 1000000, dim), compute_rotation(rseed, dim), math.sqrt(10.0))
+    return lambda x: f_sharp_ridge_raw(affine(x - xopt, m)) + fopt, fopt
+
+
+def build_different_powers(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed, dim)
+    return lambda x: f_different_powers_raw(affine(x - xopt, rot1)) + fopt, fopt
+
+
+def build_rastrigin_rotated(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed + 1000000, dim)
+    m = linear_transform(rot1, compute_rotation(rseed, dim), math.sqrt(10.0))
+    return lambda x: f_rastrigin_raw(affine(t_asy(t_osz(affine(x - xopt, rot1)), 0.2), m)) + fopt, fopt
+
+
+def build_weierstrass(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed + 1000000, dim)
+    m = linear_transform(rot1, compute_rotation(rseed, dim), 1.0 / math.sqrt(100.0))
+    return lambda x: f_weierstrass_raw(affine(t_osz(affine(x - xopt, rot1)), m)) + fopt + 10.0 / dim * penalty(x), fopt
+
+
+def build_schaffers(function, dim, instance, rseed, conditioning):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed + 1000000, dim)
+    m = np.power(math.sqrt(conditioning), np.arange(dim) / (dim - 1.0))[:, None] * compute_rotation(rseed, dim)
+    return lambda x: f_schaffers_raw(affine(t_asy(affine(x - xopt, rot1), 0.5), m)) + fopt + 10.0 * penalty(x), fopt
+
+
+def build_griewank_rosenbrock(function, dim, instance, rseed):
+    fopt = compute_fopt(function, instance)
+    m = max(1., math.sqrt(dim) / 8.) * compute_rotation(rseed, dim)
+    return lambda x: f_griewank_rosenbrock_raw(affine(x, m) + 0.5) + fopt, fopt
+
+
+def build_schwefel(function, dim, instance, rseed):
+    fopt = compute_fopt(function, instance)
+    sign = np.where(unif(dim, rseed) < 0.5, -1., 1.)
+    two_abs_xopt = 2 * np.abs(sign * 0.5 * 4.2096874637)
+    lam = np.power(math.sqrt(10.0), np.arange(dim) / (dim - 1.0))
+
+    def f(x):
+        x_hat = 2 * (sign * x)
+        z = x_hat.copy()
+        z[:, 1:] = x_hat[:, 1:] + 0.25 * (x_hat[:, :-1] - two_abs_xopt[:-1])
+        z = 100 * (lam * (z - two_abs_xopt) + two_abs_xopt)
+        return f_schwefel_raw(z) + fopt
+    return f, fopt
+
+
+def build_gallagher(function, dim, instance, rseed, number_of_peaks):
+    fopt = compute_fopt(function, instance)
+    maxcondition = 1000.
+    if number_of_peaks == 101:
+        maxcondition1 = math.sqrt(1000.)
+        b, c = 10., 5.
+    else:
+        maxcondition1 = 1000.
+        b, c = 9.8, 4.9
+    rotation = compute_rotation(rseed, dim)
+
+    # stable sort by value, as qsort over distinct uniforms
+    rperm = np.argsort(unif(number_of_peaks - 1, rseed), kind='stable')
+    arr_condition = np.empty(number_of_peaks)
+    arr_condition[0] = maxcondition1
+    arr_condition[1:] = np.power(maxcondition, rperm / (number_of_peaks - 2.))
+    peak_values = np.empty(number_of_peaks)
+    peak_values[0] = 10.
+    peak_values[1:] = np.arange(number_of_peaks - 1) / (number_of_peaks - 2.) * (9.1 - 1.1) + 1.1
+
+    arr_scales = np.empty((number_of_peaks, dim))
+    for i in range(number_of_peaks):
+        rperm = np.argsort(unif(dim, rseed + 1000 * i), kind='stable')
+        arr_scales[i] = np.power(arr_condition[i], rperm / (dim - 1.) - 0.5)
+
+    random_numbers = unif(dim * number_of_peaks, rseed).reshape(number_of_peaks, dim)
+    x_local = (b * random_numbers - c) @ rotation.T
+    x_local[0] *= 0.8
+    fac = -0.5 / dim
+
+    def f(x):
+        f_pen = np.sum(np.maximum(np.abs(x) - 5., 0.) ** 2, axis=1)
+        tmx = affine(x, rotation)
+        diff = tmx[:, None, :] - x_local[None, :, :]
+        tmp2 = peak_values * np.exp(fac * np.sum(arr_scales * diff * diff, axis=2))
+        y = 10. - np.maximum(np.max(tmp2, axis=1), 0.)
+        y = t_osz(y[:, None])[:, 0]
+        return y * y + f_pen + fopt
+    return f, fopt
+
+
+def build_katsuura(function, dim, instance, rseed):
+    xopt = compute_xopt(rseed, dim)
+    fopt = compute_fopt(function, instance)
+    m = linear_transform(compute_rotation(rseed + 1000000, dim), compute_rotation(rseed, dim), math.sqrt(100.))
+    return lambda x: f_katsuura_raw(affine(x - xopt, m)) + fopt + penalty(x), fopt
+
+
+def build_lunacek_bi_rastrigin(function, dim, instance, rseed):
+    fopt = compute_fopt(function, instance)
+    rot1 = compute_rotation(rseed + 1000000, dim)
+    rot2 = compute_rotation(rseed, dim)
+    mu0 = 2.5
+    d = 1.
+    s = 1. - 0.5 / (math.sqrt(dim + 20.) - 4.1)
+    mu1 = -math.sqrt((mu0 * mu0 - d) / s)
+    sign = np.where(gauss(dim, rseed) < 0., -1., 1.)
+    c1 = np.power(math.sqrt(100.), np.arange(dim) / (dim - 1.))
+
+    def f(x):
+        pen = np.sum(np.maximum(np.abs(x) - 5.0, 0.) ** 2, axis=1)
+        x_hat = 2. * x * sign
+        z = affine(c1 * affine(x_hat - mu0, rot2), rot1)
+        sum1 = np.sum((x_hat - mu0) ** 2, axis=1)
+        sum2 = np.sum((x_hat - mu1) ** 2, axis=1)
+        sum3 = np.sum(np.cos(2 * math.pi * z), axis=1)
+        return np.minimum(sum1, d * dim + s * sum2) + 10. * (dim - sum3) + 1e4 * pen + fopt
+    return f, fopt
+
+
+def build_problem(function, dim, instance):
+    rseed = function + 10000 * instance
+    if function == 1:
+        return build_sphere(function, dim, instance, rseed)
+    elif function == 2:
+        return build_ellipsoid(function, dim, instance, rseed)
+    elif function == 3:
+        return build_rastrigin(function, dim, instance, rseed)
+    elif function == 4:
+        return build_bueche_rastrigin(function, dim, instance, 3 + 10000 * instance)
+    elif function == 5:
+        return build_linear_slope(function, dim, instance, rseed)
+    elif function == 6:
+        return build_attractive_sector(function, dim, instance, rseed)
+    elif function == 7:
+        return build_step_ellipsoid(function, dim, instance, rseed)
+    elif function == 8:
+        return build_rosenbrock(function, dim, instance, rseed)
+    elif function == 9:
+        return build_rosenbrock_rotated(function, dim, instance, rseed)
+    elif function == 10:
+        return build_ellipsoid_rotated(function, dim, instance, rseed)
+    elif function == 11:
+        return build_discus(function, dim, instance, rseed)
+    elif function == 12:
+        return build_bent_cigar(function, dim, instance, rseed)
+    elif function == 13:
+        return build_sharp_ridge(function, dim, instance, rseed)
+    elif function == 14:
+        return build_different_powers(function, dim, instance, rseed)
+    elif function == 15:
+        return build_rastrigin_rotated(function, dim, instance, rseed)
+    elif function == 16:
+        return build_weierstrass(function, dim, instance, rseed)
+    elif function == 17:
+        return build_schaffers(function, dim, instance, rseed, 10)
+    elif function == 18:
+        return build_schaffers(function, dim, instance, 17 + 10000 * instance, 1000)
+    elif function == 19:
+        return build_griewank_rosenbrock(function, dim, instance, rseed)
+    elif function == 20:
+        return build_schwefel(function, dim, instance, rseed)
+    elif function == 21:
+        return build_gallagher(function, dim, instance, rseed, 101)
+    elif function == 22:
+        return build_gallagher(function, dim, instance, rseed, 21)
+    elif function == 23:
+        return build_katsuura(function, dim, instance, rseed)
+    elif function == 24:
+        return build_lunacek_bi_rastrigin(function, dim, instance, rseed)
+    else:
+        raise NotImplementedError
+
+
+class Problem(object):
+
+    def __init__(self, function, dimension, instance, index):
+        self.function = function
+        self.dimension = dimension
+        self.number_of_variables = dimension
+        self.instance = instance
+        self.index = index
+        self.id = 'bbob_f{:03d}_i{:02d}_d{:02d}'.format(function, instance, dimension)
+        self.lower_bounds = -5. * np.ones(dimension)
+        self.upper_bounds = 5. * np.ones(dimension)
+        self.initial_solution = np.zeros(dimension)
+        self.func, self.best_value = build_problem(function, dimension, instance)
+        self.final_target_fvalue1 = self.best_value + 1e-8
+
+        self.evaluations = 0
+        self.best_observed_fvalue1 = np.inf
+        self.final_target_hit = 0
+
+    def count(self, f):
+        if len(f):
+            self.evaluations += len(f)
+            self.best_observed_fvalue1 = min(self.best_observed_fvalue1, np.min(f))
+            self.final_target_hit = int(self.best_observed_fvalue1 <= self.final_target_fvalue1)
+
+    def batch(self, x):
+        x = np.asarray(x, dtype=np.float64).reshape(-1, self.dimension)
+        f = self.func(x)
+        self.count(f)
+        return f
+
+    def batch_until(self, x, target):
+        # the functions have no side effects, the whole batch is evaluated in one call and only the rows
+        # up to the first one at or below target are kept and counted
+        x = np.asarray(x, dtype=np.float64).reshape(-1, self.dimension)
+        f = self.func(x)
+        hit = np.flatnonzero(f <= target)
+        if len(hit):
+            f = f[:hit[0] + 1]
+        self.count(f)
+        return f
+
+    def __call__(self, x):
+        if np.ndim(x) == 2:
+            return self.batch(x)
+        return float(self.batch(x)[0])
+
+
+def parse_ranges(ranges):
+    values = []
+    for r in ranges.split(','):
+        bounds = r.split('-')
+        values.extend(range(int(bounds[0]), int(bounds[-1]) + 1))
+    return values
+
+
+def parse_options(options):
+    return {k: re.sub(r'\s', '', v) for k, v in re.findall(r'(\w+)\s*:\s*([0-9][0-9,\-\s]*)', options)}
+
+
+class Suite(object):
+
+    def __init__(self, suite_name, suite_instance, suite_options):
+        assert suite_name == 'bbob', "only the bbob suite is implemented"
+        self.dimensions = parse_ranges(parse_options(suite_options).get('dimensions', '2,3,5,10,20,40'))
+        self.instances = parse_ranges(parse_options(suite_instance).get('instances', DEFAULT_INSTANCES))
+        self.functions = list(range(1, 25))
+
+    def __len__(self):
+        return len(self.functions) * len(self.dimensions) * len(self.instances)
+
+    def reset(self):
+        return
+
+    def get_problem(self, index):
+        n_instances = len(self.instances)
+        n_dimensions = len(self.dimensions)
+        instance = self.instances[index % n_instances]
+        dimension = self.dimensions[(index // n_instances) % n_dimensions]
+        function = self.functions[index // (n_instances * n_dimensions)]
+        return Problem(function, dimension, instance, index)
+
+
+def make_suite(dimension):
+    options = "dimensions: " + str(dimension)
+    if args.bbob_backend == 'native':
+        return Suite("bbob", "", options)
+    return cocoex.Suite("bbob", "", options)
+
+
+def evaluate_points(problem, x, chunk=2**16):
+    batch = getattr(problem, 'batch', None)
+    if batch is None:
+        return np.array([problem(xi) for xi in x])
+    return np.concatenate([batch(x[i:i + chunk]) for i in range(0, len(x), chunk)])
+
+
+def check_parity(dimensions=(2, 3, 5, 10, 20, 40), n=100, rtol=1e-8):
+    mismatch = 0
+    for dim in dimensions:
+        coco_suite = cocoex.Suite("bbob", "", "dimensions: " + str(dim))
+        native_suite = Suite("bbob", "", "dimensions: " + str(dim))
+        for index in range(len(native_suite)):
+            coco_problem = coco_suite.get_problem(index)
+            native_problem = native_suite.get_problem(index)
+            assert coco_problem.id == native_problem.id, "id {} != {}".format(coco_problem.id, native_problem.id)
+
+            x = np.random.uniform(-5, 5, size=(n, dim))
+            x[0] = coco_problem.initial_solution
+            f_coco = np.array([coco_problem(xi) for xi in x])
+            f_native = native_problem.batch(x)
+
+            close = np.isclose(f_native, f_coco, rtol=rtol, atol=1e-10)
+            if not close.all() or coco_problem.final_target_fvalue1 != native_problem.final_target_fvalue1:
+                mismatch += 1
+                print("{}: {} / {} points differ, max abs err {}".format(native_problem.id, (~close).sum(), n,
+                                                                           np.abs(f_native - f_coco).max()))
+    print("parity check: {} mismatching problems".format(mismatch))
+    return mismatch == 0
+
+
+if __name__ == "__main__":
+    check_parity()
@@ -0,0 +1,80 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from config import args, DirsAndLocksSingleton
+from bbob import make_suite
+from evaluator import CostModel
+from environment import EnvCoco, EnvCostly
+from trust_region_agent import TrustRegionAgent
+
+# wall-clock benchmark of the optimizer under a synthetic evaluation cost, e.g.
+#   python benchmark.py --eval-cost sleep --eval-cost-time 0.01 --start 0 --stop 360 --filter 15
+# and the same with --eval-backend process or --async-staleness 2 to compare evaluation modes
+
+
+def make_env(problem, problem_index):
+    if args.eval_cost:
+        cost = CostModel(args.eval_cost, args.eval_cost_time, args.eval_cost_latency)
+        return EnvCostly(problem, problem_index, need_norm=True, to_numpy=True, cost=cost)
+    return EnvCoco(problem, problem_index, need_norm=True, to_numpy=True)
+
+
+def run_problem(exp_name, suite, problem_index):
+    suite.reset()
+    env = make_env(suite.get_problem(problem_index), problem_index)
+    dirs_locks = DirsAndLocksSingleton(exp_name)
+
+    start = time.time()
+    agent = TrustRegionAgent(exp_name, env, checkpoint=dirs_locks.checkpoint)
+    try:
+        for _ in agent.minimize():
+            pass
+    except RuntimeError:
+        # out of budget
+        pass
+    finally:
+        env.close()
+    wall_time = time.time() - start
+
+    return {'index': problem_index,
+            'id': env.get_problem_id(),
+            'hit': env.t,
+            'evaluations': env.samples,
+            'wall_time': wall_time,
+            'time_to_target': env.hit_time - start if env.hit_time is not None else np.nan,
+            'evals_per_sec': env.samples / wall_time,
+            'eval_time': env.eval_time,
+            'train_time': agent.train_time,
+            'other_time': wall_time - env.eval_time - agent.train_time}
+
+
+def main():
+    exp_name = "benchmark_%s_%s_%s" % (args.algorithm, args.identifier, str(args.action_space))
+    suite = make_suite(max(args.action_space, 2))
+    problems = [args.problem_index] if args.problem_index != -1 else range(args.start, args.stop, args.filter)
+
+    data = defaultdict(list)
+    for problem_index in problems:
+        for k, v in run_problem(exp_name, suite, problem_index).items():
+            data[k].append(v)
+        print("{id}: hit {hit} evaluations {evaluations} wall {wall_time:.2f}s eval {eval_time:.2f}s "
+              "train {train_time:.2f}s".format(**{k: v[-1] for k, v in data.items()}))
+
+    df = pd.DataFrame(data)
+    # with async evaluation eval_time overlaps train_time, other_time can then be negative
+    print("cost model: {} {}s/eval latency {}s | backend {} | async staleness {}".format(
+        args.eval_cost or 'none', args.eval_cost_time, args.eval_cost_latency, args.eval_backend, args.async_staleness))
+    print("solved {}/{} | median time to target {:.2f}s | evaluations/s {:.1f}".format(
+        int(df['hit'].sum()), len(df), df['time_to_target'].median(), df['evaluations'].sum() / df['wall_time'].sum()))
+    print("time split: eval {:.1%} train {:.1%} other {:.1%}".format(
+        *(df[k].sum() / df['wall_time'].sum() for k in ['eval_time', 'train_time', 'other_time'])))
+
+    path = os.path.join(DirsAndLocksSingleton(exp_name).root, 'benchmark.csv')
+    df.to_csv(path, index=False)
+    print("saved to {}".format(path))
+
+
+if __name__ == '__main__':
+    main()
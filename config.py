@@ -48,6 +48,7 @@ parser.add_argument('--latent', type=int, default=10, help='Size of latent space
 
 # # booleans
 boolean_feature("load-last-model", False, 'Load the last saved model')
+boolean_feature("checkpoint-cache", False, 'Include the evaluation memo cache in checkpoints')
 boolean_feature("tensorboard", False, "Log results to tensorboard")
 parser.add_argument('--grad-clip', type=float, default=0, help='grad clipping')
 parser.add_argument('--vae', type=str, default='gaussian', help='gaussian')
@@ -63,24 +64,54 @@ parser.add_argument('--cone-angle', type=float, default=2, help='cone angle - de
 parser.add_argument('--explore', type=str, default='ball', help='exploration option - ball | cone | rand')
 boolean_feature("best-explore-update", True, 'move to the best value of exploration')
 parser.add_argument('--trust-region-con', type=int, default=10, help='Trust Region Condition')
+parser.add_argument('--async-staleness', type=int, default=0, help='Exploration batches evaluated in the background during training, 0 for serial. '
+                    'They run one after the other on a worker with its own problem instance, above 1 the worker is kept busy '
+                    'back to back at the price of staler batches. Not supported by the vae env')
+boolean_feature("target-stop", False, 'Stop evaluating a batch and finish the problem as soon as the final target is hit. '
+                'The native bbob backend still evaluates the batch in one call and drops the rows after the hit, '
+                'coco and costly problems are evaluated row by row, which is slower for cheap functions')
 parser.add_argument('--min-iter', type=int, default=40, help='Minimum iteration')
 parser.add_argument('--agent', type=str, default='trust', help='Agent type - trust|robust|single')
 
 #
 # #dataloader
-parser.add_argument('--cpu-workers', type=int, default=24, help='How many CPUs will be used for the data loading')
+parser.add_argument('--cpu-workers', type=int, default=24, help='How many CPUs will be used for the data loading and the process evaluation backend')
+boolean_feature("batch-eval", True, 'Evaluate a whole exploration batch in a single call')
+parser.add_argument('--eval-backend', type=str, default='serial', help='Black-box evaluation backend: serial | process')
+parser.add_argument('--eval-cache', type=int, default=0, help='LRU size of the evaluation memo cache, 0 to disable')
+parser.add_argument('--eval-cache-tol', type=float, default=0, help='Quantization of the cache key, 0 for exact policies')
+parser.add_argument('--eval-cost', type=str, default='', help='Synthetic evaluation cost: sleep | burn | size, empty for none')
+parser.add_argument('--eval-cost-time', type=float, default=1e-3, help='Seconds of synthetic cost per evaluation')
+parser.add_argument('--eval-cost-latency', type=float, default=0, help='Per-call latency of the size cost model')
+parser.add_argument('--eval-server', type=str, default='', help='Evaluation server address, a unix socket path or host:port. Empty for in-process evaluation')
+parser.add_argument('--eval-pool', type=int, default=4, help='Connections to the evaluation server')
+parser.add_argument('--bbob-backend', type=str, default='coco', help='BBOB function implementation: coco | native (vectorized numpy port of cocoex)')
+boolean_feature("multi-fidelity", False, 'Evaluate exploration on a cheap low fidelity and pi on the expensive one, the budget is in cost units')
+parser.add_argument('--low-fidelity-cost', type=float, default=0.1, help='Cost of a low fidelity evaluation, in units of a high fidelity one')
+parser.add_argument('--low-fidelity-noise', type=float, default=0.1, help='Relative gaussian noise of the low fidelity stand-in')
+parser.add_argument('--low-fidelity-bias', type=float, default=0.2, help='Relative bias of the low fidelity stand-in')
+parser.add_argument('--explore-fidelity', type=str, default='low', help='Fidelity of the exploration batches with --multi-fidelity: low | high')
 parser.add_argument('--cuda-default', type=int, default=0, help='Default GPU')
 #
 # #train parameters
 parser.add_argument('--printing-interval', type=int, default=50, help='Number of exploration steps between printing results')
 parser.add_argument('--replay-memory-factor', type=int, default=32, help='Replay factor')
+parser.add_argument('--replay-evict', type=float, default=0, help='On a trust region squeeze drop replay groups outside mu +- replay_evict * sigma, 0 keeps everything')
 parser.add_argument('--warmup-minibatch', type=int, default=5, help='Warm up batches')
+boolean_feature("warm-start", False, 'Carry the surrogate over a trust region restart instead of resetting it')
+parser.add_argument('--warm-start-minibatch', type=int, default=1, help='Warm up batches after a warm restart, at least 1')
+parser.add_argument('--warm-start-iter', type=int, default=10, help='Distillation and training epochs after a warm restart')
 parser.add_argument('--trust-factor', type=float, default=0.9, help='Warm up factor')
 parser.add_argument('--r-norm-alg', type=str, default='log', help='log |relu | tanh | none')
 parser.add_argument('--epsilon-factor', type=float, default=0.97, help='Epsilon factor')
 parser.add_argument('--learn-iteration', type=int, default=60, help='Learning iteration')
 parser.add_argument('--alpha', type=float, default=0.5, help='moving avg factor')
 parser.add_argument('--loss', type=str, default='huber', help='derivative loss huber|mse')
+parser.add_argument('--egl-pairs', type=str, default='one', help='EGL pairs per anchor: one (a random reference of its group) | all (every pair of the group)')
+parser.add_argument('--early-stop-patience', type=int, default=0, help='Stop surrogate training after this many epochs without improvement on the newest exploration group, 0 to always run learn-iteration epochs')
+parser.add_argument('--early-stop-tol', type=float, default=1e-3, help='Relative held-out loss improvement that resets the early stopping patience')
+parser.add_argument('--loss-trace', type=int, default=0, help='Keep the loss of every n-th training step as a diagnostic, 0 for the epoch average only')
+parser.add_argument('--egl-topk', type=int, default=0, help='With --egl-pairs all, only the k nearest references of every anchor, 0 for all of them')
 parser.add_argument('--start', type=int, default=0, help='')
 parser.add_argument('--stop', type=int, default=360, help='')
 parser.add_argument('--filter', type=int, default=15, help='')
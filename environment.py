@@ -1,26 +1,226 @@
+import os
+import time
 import numpy as np
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from config import args
+from timing import Timers
+from evaluator import make_evaluator, CocoProblemFactory, CostlyProblemFactory, CostlyProblem, EvalCache, SerialEvaluator, \
+    ProcessPoolEvaluator, evaluate_rows, restore_counters
+
+TRACE_MAGIC = b'EGLTRACE'
+TRACE_HEADER = 16
+
+def trace_dtype(dim):
+    return np.dtype([('frame', '<i8'), ('f', '<f8'), ('best', '<f8'), ('x', '<f8', (dim,))])
+
+def load_trace(path):
+    # zero-copy view of an evaluation trace, it is safe to open while the run is still appending to it
+    with open(path, 'rb') as fh:
+        header = fh.read(TRACE_HEADER)
+    assert header[:len(TRACE_MAGIC)] == TRACE_MAGIC, "not an evaluation trace {}".format(path)
+    dtype = trace_dtype(int(np.frombuffer(header[len(TRACE_MAGIC):], dtype='<i8')[0]))
+    # a record that is only partially flushed is left out
+    n = (os.path.getsize(path) - TRACE_HEADER) // dtype.itemsize
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=TRACE_HEADER, shape=(n,))
+
+def load_best_list(directory):
+    path = os.path.join(directory, 'trace.bin')
+    if os.path.exists(path):
+        return load_trace(path)['best']
+    # runs from before the binary trace
+    return np.load(os.path.join(directory, 'best_list_with_explore.npy'), allow_pickle=True)
+
+class EvalTrace(object):
+
+    def __init__(self, capacity=1024):
+        self.n = 0
+        self.n_pi = 0
+        self.observed = np.empty(capacity, dtype=np.float64)
+        self.best = np.empty(capacity, dtype=np.float64)
+        self.pi = None
+        self.path = None
+        self.file = None
+        self.dtype = None
+        self.written = 0
+
+    def open(self, path):
+        self.close()
+        self.path = path
+
+    def write(self, frame, observed, best, x):
+        if self.path is None or not len(observed):
+            return
+        if torch.is_tensor(x):
+            x = x.detach().cpu().numpy()
+        x = np.asarray(x, dtype=np.float64).reshape(len(observed), -1)
+        if self.file is None:
+            self.dtype = trace_dtype(x.shape[1])
+            self.file = open(self.path, 'wb')
+            self.file.write(TRACE_MAGIC + np.array([x.shape[1]], dtype='<i8').tobytes())
+
+        records = np.empty(len(observed), dtype=self.dtype)
+        records['frame'] = frame
+        records['f'] = observed
+        records['best'] = best
+        records['x'] = x
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.written += len(observed)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def snapshot(self):
+        # with a trace file the evaluations are already on disk, only the pi list is kept in memory
+        state = {'pi': self.pi_view().copy() if self.pi is not None else None, 'written': self.written}
+        if self.path is None:
+            state['observed'] = self.observed_view().copy()
+            state['best'] = self.best_view().copy()
+        return state
+
+    def restore(self, state):
+        self.pi = None
+        self.n_pi = 0
+        if state['pi'] is not None:
+            self.pi = np.empty((max(1024, len(state['pi'])),) + state['pi'].shape[1:], dtype=np.float64)
+            self.n_pi = len(state['pi'])
+            self.pi[:self.n_pi] = state['pi']
+
+        # records written after the snapshot are dropped, the file continues from the snapshot
+        self.close()
+        self.written = state['written']
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, 'rb') as fh:
+                header = fh.read(TRACE_HEADER)
+            self.dtype = trace_dtype(int(np.frombuffer(header[len(TRACE_MAGIC):], dtype='<i8')[0]))
+            with open(self.path, 'r+b') as fh:
+                fh.truncate(TRACE_HEADER + self.written * self.dtype.itemsize)
+            records = load_trace(self.path)
+            observed, best = np.array(records['f']), np.array(records['best'])
+            del records
+            self.file = open(self.path, 'ab')
+        else:
+            observed, best = state.get('observed', np.empty(0)), state.get('best', np.empty(0))
+
+        self.n = len(observed)
+        self.observed = self.grow(self.observed, self.n)
+        self.best = self.grow(self.best, self.n)
+        self.observed[:self.n] = observed
+        self.best[:self.n] = best
+
+    @staticmethod
+    def grow(buffer, n):
+        capacity = len(buffer)
+        while capacity < n:
+            capacity *= 2
+        if capacity == len(buffer):
+            return buffer
+        new_buffer = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+        new_buffer[:len(buffer)] = buffer
+        return new_buffer
+
+    def append(self, observed, best, x=None, frame=0):
+        if x is not None:
+            self.write(frame, [observed], [best], x)
+        if self.n == len(self.observed):
+            self.observed = self.grow(self.observed, self.n + 1)
+            self.best = self.grow(self.best, self.n + 1)
+        self.observed[self.n] = observed
+        self.best[self.n] = best
+        self.n += 1
+
+    def extend(self, observed, best, x=None, frame=0):
+        if x is not None:
+            self.write(frame, observed, best, x)
+        n = self.n + len(observed)
+        self.observed = self.grow(self.observed, n)
+        self.best = self.grow(self.best, n)
+        self.observed[self.n:n] = observed
+        self.best[self.n:n] = best
+        self.n = n
+
+    def append_pi(self, pi):
+        if torch.is_tensor(pi):
+            pi = pi.detach().cpu().numpy()
+        pi = np.asarray(pi, dtype=np.float64).flatten()
+        if self.pi is None:
+            self.pi = np.empty((1024, len(pi)), dtype=np.float64)
+        elif self.n_pi == len(self.pi):
+            self.pi = self.grow(self.pi, self.n_pi + 1)
+        self.pi[self.n_pi] = pi
+        self.n_pi += 1
+
+    def observed_view(self):
+        return self.observed[:self.n]
+
+    def best_view(self):
+        return self.best[:self.n]
+
+    def pi_view(self):
+        if self.pi is None:
+            return np.empty((0, 0), dtype=np.float64)
+        return self.pi[:self.n_pi]
 
 class Env(object):
 
+    snapshot_attributes = ['samples', 'discarded', 'spent', 'k', 't', 'frame', 'best_observed', 'best_observed_fvalue1', 'timers']
+    problem_attributes = ['evaluations', 'best_observed_fvalue1', 'final_target_hit']
+    multi_fidelity = False
+
     def __init__(self, problem_iter, need_norm=True, to_numpy=True):
         self.need_norm = need_norm
         self.problem_iter = problem_iter
-        self.observed_list = []
-        self.best_list = []
-        self.pi_list = []
         self.to_numpy = to_numpy
+        use_cuda = not args.no_cuda and torch.cuda.is_available()
+        self.device = torch.device("cuda" if use_cuda else "cpu")
         self.budget = 1.1*args.budget
+        self.trace = EvalTrace(int(self.budget) + 1)
         self.samples = 0
+        self.discarded = 0
+        # budget in cost units, one per evaluation unless the env prices its fidelities
+        self.spent = 0.
+        self.frame = 0
+        self.factory = None
+        self.evaluator = None
+        self.executor = None
+        self.async_evaluator = None
+        self.cache = EvalCache(args.eval_cache, args.eval_cache_tol) if args.eval_cache > 0 else None
+        self.best_observed_fvalue1 = np.inf
+        self.final_target_fvalue1 = -np.inf
+        self.target_stop = args.target_stop
+        self.timers = Timers()
+        self.hit_time = None
 
         if self.need_norm:
             self.denormalize = self.with_denormalize
         else:
             self.denormalize = self.no_normalization
 
+    def snapshot(self, cache=False):
+        # everything needed to continue a run without spending a single evaluation. The memo cache
+        # is only an accelerator, it is left out unless asked for
+        state = {name: getattr(self, name, None) for name in self.snapshot_attributes}
+        state['trace'] = self.trace.snapshot()
+        state['cache'] = self.cache.snapshot() if cache and self.cache is not None else None
+        state['problem'] = {name: getattr(self.problem, name) for name in self.problem_attributes
+                            if hasattr(self.problem, name)}
+        return state
+
+    def restore(self, state):
+        for name in self.snapshot_attributes:
+            setattr(self, name, state[name])
+        self.trace.restore(state['trace'])
+        if self.cache is not None and state['cache'] is not None:
+            self.cache.restore(state['cache'])
+        restore_counters(self.problem, state['problem'])
+
     def get_observed_and_pi_list(self):
-        return self.best_list, self.observed_list, self.pi_list
+        return self.trace.best_view(), self.trace.observed_view(), self.trace.pi_view()
 
     def get_problem_dim(self):
         raise NotImplementedError
@@ -40,9 +240,59 @@ class Env(object):
     def reset(self):
         raise NotImplementedError
 
-    def step_policy(self, policy):
+    def prepare_policy(self, policy):
         raise NotImplementedError
 
+    @property
+    def eval_time(self):
+        return self.timers.total('eval')
+
+    def time_step(self, start, eval_start, n):
+        elapsed = time.perf_counter() - start
+        self.timers.add('step', elapsed)
+        self.timers.add('step_row', elapsed / max(n, 1), n)
+        self.timers.add('overhead', elapsed - (self.timers.total('eval') - eval_start))
+
+    def step_policy(self, policy):
+        start = time.perf_counter()
+        eval_start = self.timers.total('eval')
+        policy = self.prepare_policy(policy)
+        self.timers.add('prepare', time.perf_counter() - start)
+        reward, _ = self.evaluate_batch(policy)
+        self.set_reward(reward)
+        self.time_step(start, eval_start, len(policy))
+
+    def submit_policy(self, policy):
+        # the background thread only runs the evaluator, all bookkeeping is done in complete_policy
+        start = time.perf_counter()
+        policy = self.prepare_policy(policy)
+        self.timers.add('prepare', time.perf_counter() - start)
+        reward, miss = self.lookup(policy)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.async_evaluator = self.make_async_evaluator()
+        return policy, reward, miss, self.executor.submit(self.evaluate_misses, policy, miss, self.async_evaluator)
+
+    def complete_policy(self, pending):
+        policy, reward, miss, future = pending
+        return self.merge_batch(policy, reward, miss, future.result())
+
+    def cancel_policy(self, pending):
+        # only a batch that has not started evaluating can be dropped
+        return pending[3].cancel()
+
+    def collect_policy(self, pending):
+        reward, _ = self.complete_policy(pending)
+        self.set_reward(reward)
+
+    def set_reward(self, reward):
+        if self.spent >= self.budget:
+            raise RuntimeError
+        # zero-copy on cpu, a single host to device copy otherwise
+        start = time.perf_counter()
+        self.reward = torch.from_numpy(np.asarray(reward, dtype=np.float32)).to(self.device)
+        self.timers.add('to_tensor', time.perf_counter() - start)
+
     def f(self, policy):
         raise NotImplementedError
 
@@ -52,6 +302,88 @@ class Env(object):
     def denormalize(self):
         raise NotImplementedError
 
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.async_evaluator is not None and self.async_evaluator is not self.evaluator:
+            self.async_evaluator.close()
+        if self.evaluator is not None:
+            self.evaluator.close()
+        self.trace.close()
+
+    def lookup(self, policy):
+        if self.cache is None:
+            return np.empty(len(policy), dtype=np.float64), np.ones(len(policy), dtype=bool)
+        start = time.perf_counter()
+        reward, miss = self.cache.lookup(policy)
+        self.timers.add('cache', time.perf_counter() - start)
+        return reward, miss
+
+    def stop_target(self):
+        return self.final_target_fvalue1 if self.target_stop else None
+
+    def evaluate_misses(self, policy, miss, evaluator=None):
+        # the new rewards, and how many evaluations were spent on rows that were dropped after a target hit
+        evaluator = evaluator or self.evaluator
+        if not miss.any():
+            return np.empty(0, dtype=np.float64), 0
+        start = time.perf_counter()
+        reward = evaluator(policy[miss], self.stop_target())
+        self.time_eval(time.perf_counter() - start, len(reward))
+        return reward, evaluator.discarded
+
+    def time_eval(self, elapsed, n):
+        self.timers.add('eval', elapsed)
+        self.timers.add('eval_row', elapsed / max(n, 1), n)
+
+    def make_async_evaluator(self):
+        # background batches get their own problem instance, so the pi evaluations of the main thread do
+        # not queue behind the batches in flight. A process pool is shared, it can be mapped from both threads
+        if self.factory is None or isinstance(self.evaluator, ProcessPoolEvaluator):
+            return self.evaluator
+        _, problem = self.factory()
+        return SerialEvaluator(problem, batch_eval=args.batch_eval)
+
+    def evaluate_batch(self, policy):
+        reward, miss = self.lookup(policy)
+        return self.merge_batch(policy, reward, miss, self.evaluate_misses(policy, miss))
+
+    def merge_batch(self, policy, reward, miss, evaluated):
+        start = time.perf_counter()
+        new_reward, discarded = evaluated
+        if len(new_reward) < miss.sum():
+            # the target was hit inside the batch, the rows after it were never evaluated
+            end = np.flatnonzero(miss)[len(new_reward) - 1] + 1
+            policy, reward, miss = policy[:end], reward[:end], miss[:end]
+        reward[miss] = new_reward
+        if self.cache is not None:
+            self.cache.insert(policy[miss], new_reward)
+        reward, best = self.record_batch(policy, reward, miss)
+        # evaluated concurrently with the hit but thrown away, they still count against the budget
+        self.discarded += discarded
+        self.samples += discarded
+        self.spent += discarded
+        self.timers.add('record', time.perf_counter() - start)
+        return reward, best
+
+    def record_batch(self, policy, reward, miss):
+        # best-so-far after every row, identical to reading best_observed_fvalue1 after each call.
+        # It is tracked here and not on the problem, since a pool evaluator never touches self.problem
+        best = np.minimum.accumulate(np.concatenate([[self.best_observed_fvalue1], reward]))[1:]
+
+        # cache hits are answered from memory, only new evaluations enter the trace and the budget
+        n = int(miss.sum())
+        self.trace.extend(reward[miss], best[miss], policy[miss], self.frame)
+        self.samples += n
+        self.spent += n
+        self.k += n
+        self.best_observed_fvalue1 = best[-1]
+        self.best_observed = self.best_observed_fvalue1
+        self.t = int(self.best_observed_fvalue1 <= self.final_target_fvalue1)
+        if self.t and self.hit_time is None:
+            self.hit_time = time.time()
+        return reward, best
+
 class EnvCoco(Env):
 
     def __init__(self, problem, problem_index, need_norm, to_numpy):
@@ -67,6 +399,15 @@ class EnvCoco(Env):
         self.upper_bounds = self.problem.upper_bounds
         self.lower_bounds = self.problem.lower_bounds
         self.initial_solution = self.problem.initial_solution
+        self.final_target_fvalue1 = self.problem.final_target_fvalue1
+        self.factory = self.problem_factory(problem_index)
+        self.evaluator = self.make_evaluator()
+
+    def problem_factory(self, problem_index):
+        return CocoProblemFactory(self.problem.dimension, problem_index)
+
+    def make_evaluator(self):
+        return make_evaluator(self.problem, self.factory)
 
     def get_f0(self):
         return self.problem(self.initial_solution)
@@ -103,46 +444,22 @@ class EnvCoco(Env):
         policy = 0.5 * (policy + 1) * (upper - lower) + lower
         return policy
 
-    def step_policy(self, policy):
+    def prepare_policy(self, policy):
         if self.to_numpy:
             policy = policy.cpu().numpy()
         policy = self.denormalize(policy)
         assert ((np.clip(policy, self.lower_bounds, self.upper_bounds) - policy).sum() < 0.000001), "clipping error {}".format(policy)
-        self.reward = []
-        if len(policy.shape) == 2:
-            for i in range(policy.shape[0]):
-                res = self.problem(policy[i])
-                self.observed_list.append(res)
-                self.best_list.append(self.problem.best_observed_fvalue1)
-                self.samples += 1
-                self.reward.append(res)
-                self.k += 1
-        else:
-            res = self.problem(policy)
-            self.observed_list.append(res)
-            self.best_list.append(self.problem.best_observed_fvalue1)
-            self.samples += 1
-            self.reward.append(res)
-            self.k += 1
-
-        if self.samples >= self.budget:
-            raise RuntimeError
-        self.reward = torch.cuda.FloatTensor(self.reward)
-        self.best_observed = self.problem.best_observed_fvalue1
-        self.t = self.problem.final_target_hit
+        return policy.reshape(-1, self.output_size)
 
     def f(self, policy):
         if self.to_numpy:
             policy = policy.cpu().numpy()
         policy = self.denormalize(policy)
-        res = self.problem(policy)
-        self.observed_list.append(res)
-        self.best_list.append(self.problem.best_observed_fvalue1)
-        self.pi_list.append(policy)
-        self.samples += 1
-        if self.samples >= self.budget:
+        res, _ = self.evaluate_batch(policy.reshape(1, -1))
+        self.trace.append_pi(policy)
+        if self.spent >= self.budget:
             raise RuntimeError
-        return res
+        return float(res[0])
 
     def get_problem_index(self):
         return self.problem.index
@@ -150,6 +467,122 @@ class EnvCoco(Env):
     def get_problem_id(self):
         return 'coco_' + str(self.problem.id)
 
+class EnvCostly(EnvCoco):
+
+    # EnvCoco with a synthetic evaluation cost, in the main process and in pool workers alike
+    def __init__(self, problem, problem_index, need_norm, to_numpy, cost):
+        self.cost = cost
+        super(EnvCostly, self).__init__(CostlyProblem(problem, cost), problem_index, need_norm, to_numpy)
+
+    def problem_factory(self, problem_index):
+        return CostlyProblemFactory(super(EnvCostly, self).problem_factory(problem_index), self.cost)
+
+class RemoteBatch(object):
+
+    # stands in for the future of a background batch, the requests are already on the wire and the
+    # server answers them while the agent trains
+    def __init__(self, env, handles):
+        self.env = env
+        self.handles = handles
+        self.start = time.perf_counter()
+
+    def result(self):
+        reward = self.env.problem.collect(self.handles, self.env.stop_target())
+        self.env.time_eval(time.perf_counter() - self.start, len(reward))
+        return reward, 0
+
+    def cancel(self):
+        return False
+
+class EnvRemote(EnvCoco):
+
+    # the problem is an eval_server.RemoteProblem, batching is done by its client. A synchronous step is
+    # one round trip, with --async-staleness the submitted batches stay in flight across steps
+    def problem_factory(self, problem_index):
+        # the problem lives on the server
+        return None
+
+    def make_evaluator(self):
+        return SerialEvaluator(self.problem)
+
+    def submit_policy(self, policy):
+        start = time.perf_counter()
+        policy = self.prepare_policy(policy)
+        self.timers.add('prepare', time.perf_counter() - start)
+        reward, miss = self.lookup(policy)
+        return policy, reward, miss, RemoteBatch(self, self.problem.submit(policy[miss]))
+
+    def get_problem_id(self):
+        return 'remote_' + str(self.problem.id)
+
+    def close(self):
+        super(EnvRemote, self).close()
+        self.problem.close()
+
+class EnvMultiFidelity(EnvCoco):
+
+    # exploration batches can go to a cheap low fidelity problem, pi evaluations through f always go to
+    # the expensive one. Only high fidelity values enter the trace, the cache and the best-so-far, so the
+    # target and every trust region decision are taken on the real objective. A high fidelity evaluation
+    # costs one unit and the budget is charged in these units
+    snapshot_attributes = EnvCoco.snapshot_attributes + ['low_samples']
+    multi_fidelity = True
+
+    def __init__(self, problem, low_problem, problem_index, need_norm, to_numpy, low_cost):
+        super(EnvMultiFidelity, self).__init__(problem, problem_index, need_norm, to_numpy)
+        self.low_problem = low_problem
+        self.low_evaluator = SerialEvaluator(low_problem, batch_eval=args.batch_eval)
+        self.low_cost = low_cost
+        self.low_samples = 0
+        self.fidelity = 'high'
+
+    def evaluate_low(self, policy):
+        start = time.perf_counter()
+        reward = self.low_evaluator(policy)
+        elapsed = time.perf_counter() - start
+        self.timers.add('eval_low', elapsed)
+        self.timers.add('eval_low_row', elapsed / max(len(reward), 1), len(reward))
+        return reward
+
+    def charge_low(self, reward):
+        self.low_samples += len(reward)
+        self.spent += self.low_cost * len(reward)
+        return reward, None
+
+    def step_policy(self, policy):
+        if self.fidelity == 'high':
+            return super(EnvMultiFidelity, self).step_policy(policy)
+        start = time.perf_counter()
+        policy = self.prepare_policy(policy)
+        self.timers.add('prepare', time.perf_counter() - start)
+        # the low fidelity problem is shared with the worker, a synchronous low fidelity step only comes from
+        # a warmup and the pipeline is always drained before one
+        reward, _ = self.charge_low(self.evaluate_low(policy))
+        self.set_reward(reward)
+        self.timers.add('step_low', time.perf_counter() - start)
+
+    def submit_policy(self, policy):
+        if self.fidelity == 'high':
+            return super(EnvMultiFidelity, self).submit_policy(policy)
+        # a low fidelity batch is a bare future, it is charged when it is collected
+        policy = self.prepare_policy(policy)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return self.executor.submit(self.evaluate_low, policy)
+
+    def complete_policy(self, pending):
+        if isinstance(pending, tuple):
+            return super(EnvMultiFidelity, self).complete_policy(pending)
+        return self.charge_low(pending.result())
+
+    def cancel_policy(self, pending):
+        if isinstance(pending, tuple):
+            return super(EnvMultiFidelity, self).cancel_policy(pending)
+        return pending.cancel()
+
+    def get_problem_id(self):
+        return 'mf_' + str(self.problem.id)
+
 class EnvVae(Env):
 
     def __init__(self, vae_problem, problem_index, to_numpy):
@@ -165,6 +598,11 @@ class EnvVae(Env):
         self.upper_bounds = self.problem.upper_bounds.detach().to(self.problem.device)
         self.lower_bounds = self.problem.lower_bounds.detach().to(self.problem.device)
         self.initial_solution = self.problem.initial_solution.detach().cpu().numpy()
+        self.final_target_fvalue1 = self.problem.problem.final_target_fvalue1
+        if self.cache is not None:
+            # policies stay torch tensors on the vae device, there is no host copy to key the cache with
+            print("The evaluation cache is not supported by the vae env, --eval-cache is ignored")
+            self.cache = None
 
     def get_problem_dim(self):
         return self.output_size
@@ -206,48 +644,42 @@ class EnvVae(Env):
         return policy
 
     def step_policy(self, policy):
+        start = time.perf_counter()
+        eval_start = self.timers.total('eval')
         if self.to_numpy == False:
-            policy = torch.cuda.FloatTensor(policy)
+            policy = torch.as_tensor(policy, dtype=torch.float, device=self.problem.device)
 
         policy = self.denormalize(policy)
         assert ((policy <= self.upper_bounds).all() and (policy >= self.lower_bounds).all()), "clipping error {}".format(policy)
+        policy = policy.reshape(-1, self.output_size)
+        self.timers.add('prepare', time.perf_counter() - start)
 
-        self.reward = []
-        if len(policy.shape) == 2:
-            for i in range(policy.shape[0]):
-                res = self.problem.func(policy[i])
-                self.observed_list.append(res)
-                self.best_list.append(self.problem.problem.best_observed_fvalue1)
-                self.samples += 1
-                self.reward.append(res)
-                self.k += 1
+        eval_start_time = time.perf_counter()
+        target = self.stop_target()
+        if target is None:
+            reward = self.problem.func_batch(policy)
         else:
-            res = self.problem.func(policy)
-            self.observed_list.append(res)
-            self.best_list.append(self.problem.problem.best_observed_fvalue1)
-            self.samples += 1
-            self.reward.append(res)
-            self.k += 1
-
-        if self.samples >= self.budget:
-            raise RuntimeError
+            # row by row, so nothing after the hit is decoded or evaluated
+            reward = evaluate_rows(self.problem.func, policy, target)
+        self.time_eval(time.perf_counter() - eval_start_time, len(reward))
 
-        self.reward = torch.cuda.FloatTensor(self.reward)
-        self.best_observed = self.problem.problem.best_observed_fvalue1
-        self.t = self.problem.problem.final_target_hit
+        record_start = time.perf_counter()
+        self.record_batch(policy[:len(reward)].cpu().numpy(), reward, np.ones(len(reward), dtype=bool))
+        self.timers.add('record', time.perf_counter() - record_start)
+        self.set_reward(reward)
+        self.time_step(start, eval_start, len(reward))
 
     def f(self, policy):
         if self.to_numpy == False:
-            policy = torch.cuda.FloatTensor(policy)
-
-        res = self.problem.func(policy)
-        self.observed_list.append(res)
-        self.best_list.append(self.problem.problem.best_observed_fvalue1)
-        self.pi_list.append(policy)
-        self.samples += 1
-        if self.samples >= self.budget:
+            policy = torch.as_tensor(policy, dtype=torch.float, device=self.problem.device)
+
+        policy = policy.reshape(1, -1)
+        res = self.problem.func_batch(policy)
+        self.record_batch(policy.cpu().numpy(), res, np.ones(1, dtype=bool))
+        self.trace.append_pi(policy)
+        if self.spent >= self.budget:
             raise RuntimeError
-        return res
+        return float(res[0])
 
     def get_f0(self):
         return self.problem.func(self.initial_solution)
@@ -267,6 +699,9 @@ class EnvOneD(Env):
         self.upper_bounds = self.problem.upper_bounds[0]
         self.lower_bounds = self.problem.lower_bounds[0]
         self.initial_solution = np.array([self.problem.initial_solution[0]])
+        self.final_target_fvalue1 = self.problem.final_target_fvalue1
+        self.factory = CocoProblemFactory(self.problem.dimension, problem_index)
+        self.evaluator = make_evaluator(self.problem, self.factory)
 
     def get_f0(self):
         return self.problem(one_d_change_dim(self.initial_solution).flatten())
@@ -309,47 +744,104 @@ class EnvOneD(Env):
         policy = 0.5 * (policy + 1) * (upper - lower) + lower
         return policy
 
-    def step_policy(self, policy):
+    def prepare_policy(self, policy):
         if self.to_numpy:
             policy = policy.cpu().numpy()
         policy = self.denormalize(one_d_change_dim(policy))
         assert ((np.clip(policy, self.lower_bounds, self.upper_bounds) - policy).sum() < 0.000001), "clipping error {}".format(policy)
-        self.reward = []
-        if len(policy.shape) == 2:
-            for i in range(policy.shape[0]):
-                res = self.problem(policy[i])
-                self.observed_list.append(res)
-                self.best_list.append(self.problem.best_observed_fvalue1)
-                self.samples += 1
-                self.reward.append(res)
-                self.k += 1
-        else:
-            res = self.problem(policy)
-            self.observed_list.append(res)
-            self.best_list.append(self.problem.best_observed_fvalue1)
-            self.samples += 1
-            self.reward.append(res)
-            self.k += 1
-
-        if self.samples >= self.budget:
-            raise RuntimeError
-
-        self.reward = torch.cuda.FloatTensor(self.reward)
-        self.best_observed = self.problem.best_observed_fvalue1
-        self.t = self.problem.final_target_hit
+        return policy.reshape(-1, self.output_size)
 
     def f(self, policy):
         if self.to_numpy:
             policy = policy.cpu().numpy()
-        self.pi_list.append(policy)
+        self.trace.append_pi(policy)
         policy = self.denormalize(one_d_change_dim(policy)).flatten()
-        res = self.problem(policy)
-        self.observed_list.append(res)
-        self.best_list.append(self.problem.best_observed_fvalue1)
-        self.samples += 1
-        if self.samples >= self.budget:
+        res, _ = self.evaluate_batch(policy.reshape(1, -1))
+        if self.spent >= self.budget:
             raise RuntimeError
-        return res
+        return float(res[0])
+
+class VecEnv(object):
+
+    # K coco/1D environments stepped in lockstep, K different problems or K instances of one function.
+    # Every problem keeps its own budget, cache and trace and is evaluated with one evaluator call per
+    # step, the vectorized Problem.batch with the native backend. A problem that hit its target or spent
+    # its budget is masked in done and skipped, its rows come back as nan
+    def __init__(self, envs):
+        self.envs = envs
+        self.n_envs = len(envs)
+        self.device = envs[0].device
+        self.done = np.zeros(self.n_envs, dtype=bool)
+        # requested rows per problem, the frame of its trace records
+        self.frame = np.zeros(self.n_envs, dtype=np.int64)
+        self.reward = None
+
+    def get_problem_index(self):
+        return [env.get_problem_index() for env in self.envs]
+
+    def get_problem_id(self):
+        return [env.get_problem_id() for env in self.envs]
+
+    def get_initial_solution(self):
+        return np.stack([env.get_initial_solution() for env in self.envs])
+
+    @property
+    def t(self):
+        return np.array([env.t for env in self.envs], dtype=bool)
+
+    @property
+    def best_observed(self):
+        return np.array([env.best_observed_fvalue1 for env in self.envs])
+
+    @property
+    def samples(self):
+        return np.array([env.samples for env in self.envs])
+
+    def reset(self):
+        for env in self.envs:
+            env.reset()
+        self.done[:] = False
+        self.reward = None
+
+    def update_done(self):
+        for k, env in enumerate(self.envs):
+            self.done[k] = self.done[k] or env.t or env.spent >= env.budget
+        return self.done
+
+    def step_policy(self, policy):
+        # policy is (K, N, D) in normalized coordinates, the rewards are (K, N). A batch is cut to what is
+        # left of the problem's budget instead of overshooting it
+        reward = np.full(tuple(policy.shape[:2]), np.nan, dtype=np.float64)
+        for k, env in enumerate(self.envs):
+            if self.done[k]:
+                continue
+            self.frame[k] += policy.shape[1]
+            env.frame = int(self.frame[k])
+            n = min(policy.shape[1], int(np.ceil(env.budget - env.spent)))
+            r, _ = env.evaluate_batch(env.prepare_policy(policy[k, :n]))
+            reward[k, :len(r)] = r
+        self.update_done()
+        self.reward = torch.from_numpy(reward.astype(np.float32)).to(self.device)
+        return self.reward
+
+    def f(self, policy):
+        # policy is (K, D), one evaluation per active problem, recorded in its pi list
+        reward = np.full(self.n_envs, np.nan, dtype=np.float64)
+        for k, env in enumerate(self.envs):
+            if self.done[k]:
+                continue
+            self.frame[k] += 1
+            env.frame = int(self.frame[k])
+            x = env.prepare_policy(policy[k:k + 1])
+            r, _ = env.evaluate_batch(x)
+            env.trace.append_pi(x[0])
+            reward[k] = r[0]
+        self.update_done()
+        return reward
+
+    def close(self):
+        for env in self.envs:
+            env.close()
 
 def one_d_change_dim(policy):
     policy = policy.reshape(-1, 1)
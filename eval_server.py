@@ -0,0 +1,236 @@
+import os
+import json
+import struct
+import socket
+import itertools
+import threading
+import socketserver
+import numpy as np
+from config import args
+from evaluator import CocoProblemFactory, SerialEvaluator
+
+# every frame is (request id, op, payload length) followed by the payload.
+# INFO carries json both ways, EVAL sends a float64 (n, D) batch and gets n float64 values back
+HEADER = struct.Struct('<IIQ')
+OP_INFO = 0
+OP_EVAL = 1
+OP_ERROR = 2
+
+
+def recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    received = 0
+    while received < n:
+        k = sock.recv_into(view[received:], n - received)
+        if k == 0:
+            raise ConnectionError("evaluation server connection closed")
+        received += k
+    return buf
+
+
+def send_frame(sock, request_id, op, payload=b''):
+    sock.sendall(HEADER.pack(request_id, op, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    request_id, op, n = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return request_id, op, recv_exact(sock, n)
+
+
+def parse_address(address):
+    # host:port for tcp, anything else is a unix socket path
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class Connection(object):
+
+    def __init__(self, address):
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.connect(address)
+        self.send_lock = threading.Lock()
+        self.recv_lock = threading.Lock()
+        self.responses = {}
+
+    def send(self, request_id, op, payload):
+        with self.send_lock:
+            send_frame(self.sock, request_id, op, payload)
+
+    def receive(self, request_id):
+        # several requests can be in flight on a connection, frames of the others are parked
+        with self.recv_lock:
+            while request_id not in self.responses:
+                rid, op, payload = recv_frame(self.sock)
+                self.responses[rid] = (op, payload)
+            op, payload = self.responses.pop(request_id)
+        if op == OP_ERROR:
+            raise RuntimeError("evaluation server: " + payload.decode())
+        return payload
+
+    def close(self):
+        self.sock.close()
+
+
+class EvalClient(object):
+
+    def __init__(self, address, pool_size=4):
+        self.connections = [Connection(address) for _ in range(pool_size)]
+        self.request_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def request(self, connection, op, payload):
+        with self.lock:
+            request_id = next(self.request_ids)
+        connection.send(request_id, op, payload)
+        return connection, request_id
+
+    def info(self, dimension, problem_index):
+        # every connection of the pool is bound to the same problem
+        payload = json.dumps({'dimension': dimension, 'problem_index': problem_index}).encode()
+        handles = [self.request(c, OP_INFO, payload) for c in self.connections]
+        return [json.loads(c.receive(rid).decode()) for c, rid in handles][0]
+
+    def submit(self, policy):
+        # the batch is split over the pool and all chunks are sent before any answer is read. Requests of
+        # several submits can be in flight at once, evaluate alone waits for its own answers before returning
+        policy = np.ascontiguousarray(policy, dtype=np.float64)
+        chunks = np.array_split(policy, min(len(self.connections), len(policy)))
+        return [self.request(c, OP_EVAL, chunk.tobytes()) for c, chunk in zip(self.connections, chunks)]
+
+    def collect(self, handles):
+        return np.concatenate([np.frombuffer(c.receive(rid), dtype=np.float64) for c, rid in handles])
+
+    def evaluate(self, policy):
+        if not len(policy):
+            return np.empty(0, dtype=np.float64)
+        return self.collect(self.submit(policy))
+
+    def close(self):
+        for c in self.connections:
+            c.close()
+
+
+class RemoteProblem(object):
+
+    def __init__(self, client, dimension, problem_index):
+        info = client.info(dimension, problem_index)
+        self.client = client
+        self.dimension = info['dimension']
+        self.number_of_variables = self.dimension
+        self.index = info['index']
+        self.id = info['id']
+        self.lower_bounds = np.array(info['lower_bounds'], dtype=np.float64)
+        self.upper_bounds = np.array(info['upper_bounds'], dtype=np.float64)
+        self.initial_solution = np.array(info['initial_solution'], dtype=np.float64)
+        self.final_target_fvalue1 = info['final_target_fvalue1']
+        self.evaluations = 0
+        self.best_observed_fvalue1 = np.inf
+        self.final_target_hit = 0
+
+    def submit(self, x):
+        x = np.asarray(x, dtype=np.float64).reshape(-1, self.dimension)
+        return self.client.submit(x) if len(x) else []
+
+    def collect(self, handles, target=None):
+        # with a target only the rows up to the first hit are kept and counted, like the native batch_until
+        f = self.client.collect(handles) if handles else np.empty(0, dtype=np.float64)
+        if target is not None:
+            hit = np.flatnonzero(f <= target)
+            if len(hit):
+                f = f[:hit[0] + 1]
+        if len(f):
+            self.evaluations += len(f)
+            self.best_observed_fvalue1 = min(self.best_observed_fvalue1, np.min(f))
+            self.final_target_hit = int(self.best_observed_fvalue1 <= self.final_target_fvalue1)
+        return f
+
+    def batch(self, x):
+        return self.collect(self.submit(x))
+
+    def batch_until(self, x, target):
+        return self.collect(self.submit(x), target)
+
+    def __call__(self, x):
+        return float(self.batch(x)[0])
+
+    def close(self):
+        self.client.close()
+
+
+def problem_info(problem):
+    return {'dimension': int(problem.dimension), 'index': int(problem.index), 'id': str(problem.id),
+            'lower_bounds': np.asarray(problem.lower_bounds).tolist(),
+            'upper_bounds': np.asarray(problem.upper_bounds).tolist(),
+            'initial_solution': np.asarray(problem.initial_solution).tolist(),
+            'final_target_fvalue1': float(problem.final_target_fvalue1)}
+
+
+def coco_problem(request):
+    # stand-in objective: the bbob problem asked for by the client, or the one given on the command line
+    _, problem = CocoProblemFactory(request.get('dimension', max(args.action_space, 2)),
+                                    request.get('problem_index', max(args.problem_index, 0)))()
+    return problem
+
+
+class EvalHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        problem = None
+        evaluator = None
+        while True:
+            try:
+                request_id, op, payload = recv_frame(self.request)
+            except ConnectionError:
+                return
+            try:
+                if op == OP_INFO:
+                    problem = self.server.open_problem(json.loads(payload.decode()) if payload else {})
+                    evaluator = SerialEvaluator(problem)
+                    reply = json.dumps(problem_info(problem)).encode()
+                elif op == OP_EVAL:
+                    assert problem is not None, "no problem selected, send INFO first"
+                    reply = evaluator(np.frombuffer(payload, dtype=np.float64).reshape(-1, problem.dimension)).tobytes()
+                else:
+                    raise NotImplementedError
+                send_frame(self.request, request_id, op, reply)
+            except Exception as e:
+                send_frame(self.request, request_id, OP_ERROR, repr(e).encode())
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(address, open_problem=coco_problem):
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = ThreadingUnixServer(address, EvalHandler)
+    else:
+        server = ThreadingTCPServer(address, EvalHandler)
+    server.open_problem = open_problem
+    return server
+
+
+def start_server(address, open_problem=coco_problem):
+    # in-process server on a daemon thread, for offline runs against the stand-in objective
+    server = make_server(address, open_problem)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    make_server(args.eval_server).serve_forever()
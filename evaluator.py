@@ -0,0 +1,249 @@
+import time
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+from config import args
+from bbob import make_suite
+
+# per-process state of a pool worker: (suite, problem)
+_worker_state = None
+
+
+class CocoProblemFactory(object):
+
+    def __init__(self, dimension, problem_index):
+        self.dimension = dimension
+        self.problem_index = problem_index
+
+    def __call__(self):
+        suite = make_suite(self.dimension)
+        return suite, suite.get_problem(self.problem_index)
+
+
+class CostlyProblemFactory(object):
+
+    def __init__(self, factory, cost):
+        self.factory = factory
+        self.cost = cost
+
+    def __call__(self):
+        suite, problem = self.factory()
+        return suite, CostlyProblem(problem, self.cost)
+
+
+def burn(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class CostModel(object):
+
+    # sleep: idle wait per evaluation, burn: busy cpu per evaluation,
+    # size: one latency per call plus a cost that grows with the number of rows
+    def __init__(self, kind, seconds, latency=0.):
+        self.kind = kind
+        self.seconds = seconds
+        self.latency = latency
+
+    def charge(self, n):
+        if self.kind == 'sleep':
+            time.sleep(self.seconds * n)
+        elif self.kind == 'burn':
+            burn(self.seconds * n)
+        elif self.kind == 'size':
+            time.sleep(self.latency + self.seconds * n)
+        else:
+            raise NotImplementedError
+
+
+class CostlyProblem(object):
+
+    # every row is charged, a batch cut short at the target must not skip the cost through the proxy
+    batch_until = None
+
+    def __init__(self, problem, cost):
+        self.problem = problem
+        self.cost = cost
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+    def batch(self, x):
+        self.cost.charge(len(x))
+        batch = getattr(self.problem, 'batch', None)
+        if batch is not None:
+            return np.asarray(batch(x), dtype=np.float64)
+        return np.fromiter((self.problem(xi) for xi in x), dtype=np.float64, count=len(x))
+
+    def __call__(self, x):
+        self.cost.charge(1)
+        return self.problem(x)
+
+
+class LowFidelityProblem(object):
+
+    # stand-in for the cheap mode of a simulator: the bbob function with an error that is relative to the
+    # gap from the optimum, f + (f - fopt) * (bias + noise * N(0, 1)). The optimum itself is unchanged
+    batch_until = None
+
+    def __init__(self, problem, noise, bias, seed=0):
+        self.problem = problem
+        self.noise = noise
+        self.bias = bias
+        self.fopt = problem.final_target_fvalue1 - 1e-8
+        self.rng = np.random.RandomState(seed)
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+    def batch(self, x):
+        batch = getattr(self.problem, 'batch', None)
+        if batch is not None:
+            f = np.asarray(batch(x), dtype=np.float64)
+        else:
+            f = np.fromiter((self.problem(xi) for xi in x), dtype=np.float64, count=len(x))
+        return f + (f - self.fopt) * (self.bias + self.noise * self.rng.randn(len(f)))
+
+    def __call__(self, x):
+        return float(self.batch(np.reshape(x, (1, -1)))[0])
+
+
+def restore_counters(problem, counters):
+    # the wrappers only delegate reads, the counters are set on the innermost problem so that the
+    # wrapper and the problem it wraps agree after a resume
+    while isinstance(problem, (CostlyProblem, LowFidelityProblem)):
+        problem = problem.problem
+    for name, value in counters.items():
+        try:
+            setattr(problem, name, value)
+        except AttributeError:
+            # cocoex counters are read only, the env keeps its own copy of them
+            pass
+
+
+def evaluate_rows(problem, policy, target=None):
+    if target is None:
+        return np.fromiter((problem(x) for x in policy), dtype=np.float64, count=len(policy))
+    reward = np.empty(len(policy), dtype=np.float64)
+    for i, x in enumerate(policy):
+        reward[i] = problem(x)
+        if reward[i] <= target:
+            return reward[:i + 1]
+    return reward
+
+
+def _init_worker(factory):
+    global _worker_state
+    _worker_state = factory()
+
+
+def _evaluate_chunk(chunk):
+    policy, target = chunk
+    _, problem = _worker_state
+    return SerialEvaluator(problem, batch_eval=args.batch_eval)(policy, target)
+
+
+class SerialEvaluator(object):
+
+    # rows are evaluated in order, nothing is ever evaluated and then dropped
+    discarded = 0
+
+    def __init__(self, problem, batch_eval=True):
+        self.problem = problem
+        self.batch = getattr(problem, 'batch', None) if batch_eval else None
+        # only problems without side effects can evaluate a whole batch and count just the rows up to a hit
+        self.batch_until = getattr(problem, 'batch_until', None) if batch_eval else None
+
+    def __call__(self, policy, target=None):
+        # with a target the result ends at the first row that hits it. Other problems go row by row, so
+        # the rows after the hit are never evaluated
+        if target is None and self.batch is not None:
+            return np.asarray(self.batch(policy), dtype=np.float64)
+        if target is not None and self.batch_until is not None:
+            return np.asarray(self.batch_until(policy, target), dtype=np.float64)
+        return evaluate_rows(self.problem, policy, target)
+
+    def close(self):
+        return
+
+
+class ProcessPoolEvaluator(object):
+
+    def __init__(self, factory, workers):
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(factory,))
+        # evaluations of the last call that were dropped after a target hit
+        self.discarded = 0
+
+    def __call__(self, policy, target=None):
+        chunks = np.array_split(policy, min(self.workers, len(policy)))
+        # map keeps submission order, so rows are merged back exactly as they were sent
+        rewards = self.pool.map(_evaluate_chunk, [(chunk, target) for chunk in chunks])
+        self.discarded = 0
+        if target is not None:
+            # chunks are evaluated concurrently, everything after the first hit is dropped
+            for i, reward in enumerate(rewards):
+                if len(reward) and reward[-1] <= target:
+                    self.discarded = sum(len(r) for r in rewards[i + 1:])
+                    rewards = rewards[:i + 1]
+                    break
+        return np.concatenate(rewards)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class EvalCache(object):
+
+    def __init__(self, size, tol=0):
+        self.size = size
+        self.tol = tol
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, x):
+        if self.tol > 0:
+            return np.round(x / self.tol).astype(np.int64).tobytes()
+        return x.tobytes()
+
+    def lookup(self, policy):
+        reward = np.empty(len(policy), dtype=np.float64)
+        miss = np.ones(len(policy), dtype=bool)
+        for i, x in enumerate(policy):
+            key = self.key(x)
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                reward[i] = self.memory[key]
+                miss[i] = False
+        n_miss = int(miss.sum())
+        self.hits += len(policy) - n_miss
+        self.misses += n_miss
+        return reward, miss
+
+    def snapshot(self):
+        return {'memory': list(self.memory.items()), 'hits': self.hits, 'misses': self.misses}
+
+    def restore(self, state):
+        self.memory = OrderedDict(state['memory'])
+        self.hits = state['hits']
+        self.misses = state['misses']
+
+    def insert(self, policy, reward):
+        for x, r in zip(policy, reward):
+            key = self.key(x)
+            self.memory[key] = r
+            self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+
+def make_evaluator(problem, factory=None):
+    if args.eval_backend == 'serial' or factory is None:
+        return SerialEvaluator(problem, batch_eval=args.batch_eval)
+    elif args.eval_backend == 'process':
+        return ProcessPoolEvaluator(factory, args.cpu_workers)
+    else:
+        raise NotImplementedError
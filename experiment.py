@@ -13,6 +13,13 @@ from logger import logger
 from distutils.dir_util import copy_tree
 import pickle
 
+def last(results, key):
+    # a report yielded right after a target hit can miss the values of the skipped training step
+    value = results[key]
+    if isinstance(value, list):
+        return value[-1] if len(value) else np.nan
+    return value
+
 class Experiment(object):
 
     def __init__(self, logger_file, env):
@@ -119,14 +126,14 @@ class Experiment(object):
         divergence = 0
 
         for _, bbo_results in (enumerate(player)):
-            avg_reward = torch.mean(bbo_results['rewards'][-1]).item()
+            avg_reward = torch.mean(last(bbo_results, 'rewards')).item()
             logger.info("---------------- frame: {} - Problem ID :{} ---------------".format(bbo_results['frame'], self.problem_id))
             logger.info("Problem iter index     :{}\t\tDim: {}\t\tDivergence: {} \t\tno_change: = {}".format(self.iter_index, self.action_space, bbo_results['divergence'], bbo_results['no_change']))
             if self.algorithm in ['EGL']:
-                logger.info("Statistics: mean_grad = %.3f \t grad norm = %.3f \t avg_reward = %.3f| \t derivative_loss =  %.3f" % (bbo_results['mean_grad'], bbo_results['grad_norm'], avg_reward, bbo_results['derivative_loss']))
+                logger.info("Statistics: mean_grad = %.3f \t grad norm = %.3f \t avg_reward = %.3f| \t derivative_loss =  %.3f" % (last(bbo_results, 'mean_grad'), last(bbo_results, 'grad_norm'), avg_reward, last(bbo_results, 'derivative_loss')))
             elif self.algorithm == ['IGL']:
-                logger.info("Statistics: value = %.3f \t reward = %.3f \t value_loss =  %.3f|" % (bbo_results['value'], avg_reward, bbo_results['value_loss']))
-            logger.info("Best observe  : %.3f \t Pi_evaluate: = %.3f| \tBest_pi_evaluate: = %.3f| \t best_reward: = %.3f" % (bbo_results['best_observed'], bbo_results['reward_pi_evaluate'][-1], bbo_results['best_pi_evaluate'], bbo_results['best_reward']))
+                logger.info("Statistics: value = %.3f \t reward = %.3f \t value_loss =  %.3f|" % (last(bbo_results, 'value'), avg_reward, last(bbo_results, 'value_loss')))
+            logger.info("Best observe  : %.3f \t Pi_evaluate: = %.3f| \tBest_pi_evaluate: = %.3f| \t best_reward: = %.3f" % (bbo_results['best_observed'], last(bbo_results, 'reward_pi_evaluate'), bbo_results['best_pi_evaluate'], bbo_results['best_reward']))
             logger.info("trust_region  : min_sigma: = %.3f \t\t |epsilon: = %.3f" % (bbo_results['min_trust_sigma'], bbo_results['epsilon']))
             logger.info("r_norm        : mean: =%.3f    \t\t |sigma: =%.3f" % (bbo_results['r_norm_mean'], bbo_results['r_norm_sigma']))
 
@@ -137,18 +144,18 @@ class Experiment(object):
                 self.grad_norm_on_f_eval(bbo_results['frame'])
 
             # log to tensorboard
-            if args.tensorboard:
-                pi = bbo_results['policies'][-1].cpu().numpy()
-                pi_explore = torch.mean(bbo_results['explore_policies'][-1], dim=0).cpu().numpy()
+            if args.tensorboard and len(bbo_results['policies']):
+                pi = last(bbo_results, 'policies').cpu().numpy()
+                pi_explore = torch.mean(last(bbo_results, 'explore_policies'), dim=0).cpu().numpy()
 
                 self.writer.add_scalar('evaluation/divergence', bbo_results['divergence'], bbo_results['frame'])
                 if self.algorithm in ['IGL']:
-                    self.writer.add_scalars('evaluation/value_reward', {'value': bbo_results['value'], 'reward_pi_evaluate': bbo_results['reward_pi_evaluate'][-1], 'best': bbo_results['best_observed']}, bbo_results['frame'])
-                    self.writer.add_scalar('evaluation/value_loss', bbo_results['value_loss'], bbo_results['frame'])
+                    self.writer.add_scalars('evaluation/value_reward', {'value': last(bbo_results, 'value'), 'reward_pi_evaluate': last(bbo_results, 'reward_pi_evaluate'), 'best': bbo_results['best_observed']}, bbo_results['frame'])
+                    self.writer.add_scalar('evaluation/value_loss', last(bbo_results, 'value_loss'), bbo_results['frame'])
                 if self.algorithm in ['EGL']:
-                    self.writer.add_scalar('evaluation/grad_norm', bbo_results['grad_norm'], bbo_results['frame'])
-                    self.writer.add_scalar('evaluation/derivative_loss', bbo_results['derivative_loss'], bbo_results['frame'])
-                self.writer.add_scalars('evaluation/pi_evaluate_observe', {'evaluate': bbo_results['reward_pi_evaluate'][-1], 'best': bbo_results['best_observed']}, bbo_results['frame'])
+                    self.writer.add_scalar('evaluation/grad_norm', last(bbo_results, 'grad_norm'), bbo_results['frame'])
+                    self.writer.add_scalar('evaluation/derivative_loss', last(bbo_results, 'derivative_loss'), bbo_results['frame'])
+                self.writer.add_scalars('evaluation/pi_evaluate_observe', {'evaluate': last(bbo_results, 'reward_pi_evaluate'), 'best': bbo_results['best_observed']}, bbo_results['frame'])
 
                 for i in range(len(pi)):
                     self.writer.add_scalars('evaluation/pi_' + str(i), {'pi': pi[i], 'explore': pi_explore[i]}, bbo_results['frame'])
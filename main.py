@@ -2,14 +2,16 @@ from config import consts, args
 from logger import logger
 from experiment import Experiment
 import torch
-import cocoex
 import pandas as pd
 import os
 import pwd
 import random
 import numpy as np
 from vae import VaeProblem, VAE
-from environment import EnvCoco, EnvVae, EnvOneD
+from environment import EnvCoco, EnvVae, EnvOneD, EnvRemote, EnvCostly, EnvMultiFidelity
+from evaluator import CostModel, CocoProblemFactory, LowFidelityProblem
+from eval_server import EvalClient, RemoteProblem
+from bbob import make_suite
 from collections import defaultdict
 import traceback
 
@@ -27,14 +29,17 @@ class MainRun(object):
     def __init__(self):
         self.action_space = args.action_space
         self.problem = None
+        self.env = None
         if self.action_space != 784:
-            suite_name = "bbob"
-            suite_filter_options = ("dimensions: " + str(max(self.action_space, 2)))
-            self.suite = cocoex.Suite(suite_name, "", suite_filter_options)
+            self.suite = make_suite(max(self.action_space, 2))
 
     def reset(self, problem_index):
+        if self.env is not None:
+            self.env.close()
         if self.action_space == 784:
             self.problem = VaeProblem(problem_index)
+        elif args.eval_server:
+            self.problem = RemoteProblem(EvalClient(args.eval_server, args.eval_pool), max(self.action_space, 2), problem_index)
         else:
             self.suite.reset()
             self.problem = self.suite.get_problem(problem_index)
@@ -43,9 +48,21 @@ class MainRun(object):
 
     def set_env(self, problem_index):
         if self.action_space == 784:
+            assert not args.async_staleness, "--async-staleness is not supported by the vae env, it evaluates on the main thread only"
             self.env = EnvVae(self.problem, problem_index, to_numpy=True)
+        elif args.eval_server:
+            self.env = EnvRemote(self.problem, problem_index, need_norm=True, to_numpy=True)
         elif self.action_space == 1:
             self.env = EnvOneD(self.problem, problem_index, need_norm=True, to_numpy=True)
+        elif args.eval_cost:
+            cost = CostModel(args.eval_cost, args.eval_cost_time, args.eval_cost_latency)
+            self.env = EnvCostly(self.problem, problem_index, need_norm=True, to_numpy=True, cost=cost)
+        elif args.multi_fidelity:
+            # the low fidelity works on its own copy of the problem, it never touches the real counters
+            _, problem = CocoProblemFactory(self.problem.dimension, problem_index)()
+            low_problem = LowFidelityProblem(problem, args.low_fidelity_noise, args.low_fidelity_bias, seed=args.seed)
+            self.env = EnvMultiFidelity(self.problem, low_problem, problem_index, need_norm=True, to_numpy=True,
+                                        low_cost=args.low_fidelity_cost)
         else:
             self.env = EnvCoco(self.problem, problem_index, need_norm=True, to_numpy=True)
 
@@ -88,19 +105,20 @@ def main():
             data['iter_index'].append(i)
             data['divergence'].append(divergence)
             data['index'].append(main_run.env.problem.index)
-            data['hit'].append(main_run.env.problem.final_target_hit)
+            data['hit'].append(main_run.env.t)
             data['id'].append(main_run.env.get_problem_id())
             data['dimension'].append(main_run.env.problem.dimension)
-            data['best_observed'].append(main_run.env.problem.best_observed_fvalue1)
+            data['best_observed'].append(main_run.env.best_observed)
             data['initial_solution'].append(main_run.env.initial_solution)
             data['upper_bound'].append(main_run.env.upper_bounds)
             data['lower_bound'].append(main_run.env.lower_bounds)
-            data['number_of_evaluations'].append(main_run.env.problem.evaluations)
+            data['number_of_evaluations'].append(main_run.env.samples)
 
             df = pd.DataFrame(data)
             fmin_file = os.path.join(res_dir, run_id + '_' + str(args.action_space) + '.csv')
             df.to_csv(fmin_file)
 
+    main_run.env.close()
     logger.info("End of simulation divergence = {}".format(divergence))
 
 def run_exp(env):
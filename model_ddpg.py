@@ -5,7 +5,6 @@ import math
 from collections import defaultdict
 from torch.nn.utils import spectral_norm
 
-action_space = args.action_space
 delta = 10 # quantization levels / 2
 
 def init_weights(net, init='ortho'):
@@ -27,10 +26,10 @@ def init_weights(net, init='ortho'):
 
 class RobustNormalizer2(object):
 
-    def __init__(self, outlier=0.1, lr=0.1):
+    def __init__(self, outlier=0.1, lr=0.1, device=torch.device("cpu")):
         self.outlier = outlier
         self.lr = lr
-        self.eps = 1e-5*torch.cuda.FloatTensor([1])
+        self.eps = 1e-5*torch.ones(1, device=device)
         self.squash_eps = 1e-5
         self.m = None
         self.n = None
@@ -127,12 +126,12 @@ class NoRobustNormalizer(object):
 
 class RobustNormalizer(object):
 
-    def __init__(self, outlier=0.1, delta=1, lr=0.1):
+    def __init__(self, outlier=0.1, delta=1, lr=0.1, device=torch.device("cpu")):
         self.outlier = outlier
         self.delta = delta
         self.lr = lr
         self.temp_squash = nn.Tanh()
-        self.eps = 1e-5*torch.cuda.FloatTensor([1])
+        self.eps = 1e-5*torch.ones(1, device=device)
         self.squash_eps = 1e-9
         self.mu = None
         self.sigma = None
@@ -323,15 +322,16 @@ class MultipleOptimizer:
 
 class SplineNet(nn.Module):
 
-    def __init__(self, device, pi_net, output=1):
+    def __init__(self, device, pi_net, action_space, output=1):
         super(SplineNet, self).__init__()
         self.pi_net = pi_net
-        self.embedding = SplineEmbedding(device)
-        self.head = SplineHead(output)
+        self.action_space = action_space
+        self.embedding = SplineEmbedding(device, action_space)
+        self.head = SplineHead(action_space, output)
         self.output = output
 
     def forward(self, x, normalize=True):
-        x = x.view(-1, action_space)
+        x = x.view(-1, self.action_space)
         if normalize:
             x = self.pi_net(x)
 
@@ -344,7 +344,7 @@ class SplineNet(nn.Module):
 
 class SplineEmbedding(nn.Module):
 
-    def __init__(self, device):
+    def __init__(self, device, action_space):
         super(SplineEmbedding, self).__init__()
 
         self.delta = delta
@@ -383,13 +383,13 @@ class SplineEmbedding(nn.Module):
 
 class SplineHead(nn.Module):
 
-    def __init__(self, output=1):
+    def __init__(self, action_space, output=1):
         super(SplineHead, self).__init__()
 
         self.emb = 32
         self.actions = action_space
         self.output = output
-        self.global_interaction = GlobalModule(self.emb)
+        self.global_interaction = GlobalModule(self.emb, action_space)
         self.layer = args.layer
         input_len = self.emb + self.actions
 
@@ -431,7 +431,7 @@ class ResBlock(nn.Module):
 
 class GlobalModule(nn.Module):
 
-    def __init__(self, planes):
+    def __init__(self, planes, action_space):
         super(GlobalModule, self).__init__()
 
         self.actions = action_space
@@ -453,7 +453,6 @@ class GlobalBlock(nn.Module):
     def __init__(self, planes):
         super(GlobalBlock, self).__init__()
 
-        self.actions = action_space
         self.emb = 32
 
         self.query = nn.Sequential(
@@ -491,10 +490,11 @@ class GlobalBlock(nn.Module):
 
 class DuelNet(nn.Module):
 
-    def __init__(self, pi_net, output):
+    def __init__(self, pi_net, action_space, output):
 
         super(DuelNet, self).__init__()
         self.pi_net = pi_net
+        self.action_space = action_space
         layer = args.layer
 
         self.fc = nn.Sequential(nn.Linear(action_space, layer, bias=True),
@@ -512,7 +512,7 @@ class DuelNet(nn.Module):
             nn.init.xavier_uniform(weight.data)
 
     def forward(self, pi, normalize=True):
-        pi = pi.view(-1, action_space)
+        pi = pi.view(-1, self.action_space)
         if normalize:
             pi = self.pi_net(pi)
         x = self.fc(pi)
@@ -0,0 +1,112 @@
+import torch
+
+
+class ReplayBuffer(object):
+
+    # fixed capacity ring of (policy, reward) rows that is written in place. The capacity is a multiple of
+    # n_explore and every batch is a whole number of exploration groups, so the groups stay aligned in
+    # the storage and slot // n_explore is the group of a row, wrapped or not.
+    # Policies are kept in real coordinates and are only mapped into the current trust region when a
+    # minibatch is gathered
+    def __init__(self, capacity, dim, device):
+        self.capacity = capacity
+        self.policy = torch.zeros(capacity, dim, device=device)
+        self.reward = torch.zeros(capacity, device=device)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, policy, reward):
+        n = len(reward)
+        if n >= self.capacity:
+            self.policy.copy_(policy[-self.capacity:])
+            self.reward.copy_(reward[-self.capacity:])
+            self.head = 0
+            self.size = self.capacity
+            return
+
+        end = self.head + n
+        if end <= self.capacity:
+            self.policy[self.head:end] = policy
+            self.reward[self.head:end] = reward
+        else:
+            k = self.capacity - self.head
+            self.policy[self.head:] = policy[:k]
+            self.reward[self.head:] = reward[:k]
+            self.policy[:n - k] = policy[k:]
+            self.reward[:n - k] = reward[k:]
+        self.head = end % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def evict(self, lower, upper, group):
+        # drops every exploration group without a single row inside [lower, upper] and compacts the rest to
+        # the front, oldest first. The filled slots stay contiguous, so sampling is still a uniform draw
+        # over [0, size), and once the free slots are used up the oldest survivors are overwritten first
+        if self.size == 0 or self.size % group:
+            return 0
+        order = torch.arange(self.size, device=self.policy.device)
+        if self.size == self.capacity:
+            order = (order + self.head) % self.capacity
+        policy = self.policy[order]
+        inside = ((policy >= lower) & (policy <= upper)).all(dim=1)
+        keep = order[inside.view(-1, group).any(dim=1).repeat_interleave(group)]
+
+        n = len(keep)
+        self.policy[:n] = self.policy[keep]
+        self.reward[:n] = self.reward[keep]
+        evicted = self.size - n
+        self.size = n
+        self.head = n % self.capacity
+        return evicted
+
+    def newest_group(self, group):
+        # first slot of the last group written
+        return (self.head - group) % self.capacity
+
+    def sample_pairs(self, epochs, minibatches, batch, group, holdout=None):
+        # anchor/reference slots for every step of every epoch, drawn on the device in one go. Anchors are
+        # without replacement within an epoch, a reference is a uniform row of the anchor's group.
+        # Row k is [anchors, references] of step k, each half of length batch. The group starting at
+        # slot holdout is never drawn
+        device = self.policy.device
+        size = self.size - (group if holdout is not None else 0)
+        anchors = torch.rand(epochs, size, device=device).argsort(dim=1)[:, :minibatches * batch]
+        anchors = anchors.reshape(epochs * minibatches, batch)
+        if holdout is not None:
+            anchors = anchors + group * (anchors >= holdout)
+        refs = group * (anchors // group) + torch.randint(0, group, anchors.shape, device=device)
+        return torch.cat([anchors, refs], dim=1)
+
+    def sample_groups(self, epochs, groups, group, holdout=None):
+        # whole exploration groups instead of single anchors, every epoch is a permutation of the groups.
+        # Row k holds the slots of the groups of step k, group after group
+        device = self.policy.device
+        n_groups = self.size // group - (1 if holdout is not None else 0)
+        steps = n_groups // groups
+        index = torch.rand(epochs, n_groups, device=device).argsort(dim=1)[:, :steps * groups]
+        if holdout is not None:
+            index = index + (index >= holdout // group)
+        index = index.reshape(epochs * steps, groups, 1) * group + torch.arange(group, device=device)
+        return index.reshape(epochs * steps, groups * group)
+
+    def gather(self, index, transform):
+        # a trust region squeeze costs nothing here, the current transform is applied to the gathered rows only
+        return transform.real_to_unconstrained(self.policy[index])
+
+    def policies(self):
+        # contiguous views of the filled slots, in storage order and not in insertion order
+        return self.policy[:self.size]
+
+    def rewards(self):
+        return self.reward[:self.size]
+
+    def state_dict(self):
+        return {'policy': self.policy, 'reward': self.reward, 'head': self.head, 'size': self.size}
+
+    def load_state_dict(self, state):
+        self.policy.copy_(state['policy'])
+        self.reward.copy_(state['reward'])
+        self.head = state['head']
+        self.size = state['size']
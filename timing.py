@@ -0,0 +1,78 @@
+import math
+import threading
+import numpy as np
+from collections import defaultdict
+
+
+class LatencyHistogram(object):
+
+    # log-spaced buckets from 1us up to ~1000s, 20 per decade: constant memory and O(1) per sample,
+    # quantiles are resolved to the upper edge of a bucket (about 12% relative error)
+    def __init__(self, low=1e-6, decades=9, per_decade=20):
+        self.low = low
+        self.per_decade = per_decade
+        self.counts = np.zeros(decades * per_decade + 2, dtype=np.int64)
+        self.n = 0
+        self.total = 0.
+        self.max = 0.
+
+    def bucket(self, seconds):
+        if seconds <= self.low:
+            return 0
+        return min(int(math.log10(seconds / self.low) * self.per_decade) + 1, len(self.counts) - 1)
+
+    def add(self, seconds, n=1):
+        self.counts[self.bucket(seconds)] += n
+        self.n += n
+        self.total += seconds * n
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        if self.n == 0:
+            return np.nan
+        i = int(np.searchsorted(np.cumsum(self.counts), q * self.n))
+        return min(self.low * 10 ** (i / self.per_decade), self.max)
+
+    def summary(self):
+        return {'count': self.n, 'total': self.total, 'mean': self.total / self.n if self.n else np.nan,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99), 'max': self.max}
+
+
+class Timers(object):
+
+    # step: a whole step_policy call, step_row: the same per row, overhead: the part of a step outside
+    # the evaluator, eval: one evaluator call, eval_row: evaluator time per row,
+    # prepare: denormalize and checks, cache: memo lookup, record: cache insert, trace and bookkeeping,
+    # to_tensor: reward conversion to the device
+    def __init__(self):
+        self.histograms = defaultdict(LatencyHistogram)
+        # the evaluation worker thread records eval timings while the main thread records the rest
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'histograms': dict(self.histograms)}
+
+    def __setstate__(self, state):
+        self.histograms = defaultdict(LatencyHistogram, state['histograms'])
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, n=1):
+        with self.lock:
+            self.histograms[name].add(seconds, n)
+
+    def total(self, name):
+        with self.lock:
+            return self.histograms[name].total if name in self.histograms else 0.
+
+    def summary(self):
+        with self.lock:
+            summary = {name: h.summary() for name, h in self.histograms.items()}
+        eval_rows = summary['eval_row']['count'] if 'eval_row' in summary else 0
+        step_rows = summary['step_row']['count'] if 'step_row' in summary else 0
+        summary['throughput'] = {
+            'evaluations': eval_rows,
+            'eval_per_sec': eval_rows / self.total('eval') if self.total('eval') else np.nan,
+            'step_rows_per_sec': step_rows / self.total('step') if self.total('step') else np.nan,
+            # share of step_policy time not spent inside the black box
+            'overhead': self.total('overhead') / self.total('step') if self.total('step') else np.nan}
+        return summary
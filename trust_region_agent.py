@@ -7,9 +7,13 @@ from tqdm import tqdm
 import torch.autograd as autograd
 from model_ddpg import RobustNormalizer2, RobustNormalizer, NoRobustNormalizer, TrustRegion, NoTrustRegion
 
+import copy
 import itertools
+import time
+from collections import deque
 from agent import Agent
 import os
+import json
 from config import args
 
 class TrustRegionAgent(Agent):
@@ -25,51 +29,103 @@ class TrustRegionAgent(Agent):
             self.pi_trust_region = NoTrustRegion(self.pi_net)
 
         if args.r_norm_alg == 'log':
-            self.r_norm = RobustNormalizer2(lr=args.robust_scaler_lr)
+            self.r_norm = RobustNormalizer2(lr=args.robust_scaler_lr, device=self.device)
         elif args.r_norm_alg == 'none':
             self.r_norm = NoRobustNormalizer()
         else:
-            self.r_norm = RobustNormalizer(lr=args.robust_scaler_lr)
+            self.r_norm = RobustNormalizer(lr=args.robust_scaler_lr, device=self.device)
 
-        if self.algorithm_method == 'EGL':
+        if self.algorithm_method == 'EGL' and args.egl_pairs == 'all':
+            self.value_optimize_method = self.EGL_all_pairs_optimize
+        elif self.algorithm_method == 'EGL':
             self.value_optimize_method = self.EGL_method_optimize
         elif self.algorithm_method in ['IGL']:
             self.value_optimize_method = self.IGL_method_optimize
         else:
             raise NotImplementedError
 
-        self.best_pi = self.pi_net.pi.detach().clone()
-        self.best_pi_evaluate = self.step_policy(self.best_pi, to_env=False)
-        self.best_reward = self.best_pi_evaluate*torch.cuda.FloatTensor(1)
-        self.f0 = self.best_pi_evaluate
         self.trust_region_con = args.trust_region_con
         self.min_iter = args.min_iter
         self.no_change = 0
         self.pertub = args.pertub
-
-    def update_replay_buffer(self):
-
-        # self.tensor_replay_reward = torch.cuda.FloatTensor([])
-        # self.tensor_replay_policy = torch.cuda.FloatTensor([])
-
-        self.frame += self.warmup_minibatch*self.n_explore
-        explore_policies_rand = self.ball_explore(self.warmup_minibatch*self.n_explore)
+        self.async_staleness = args.async_staleness
+        self.pending = deque()
+        self.target_stop = args.target_stop
+        self.train_time = 0.
+        self.replay_evict = args.replay_evict
+        self.egl_topk = args.egl_topk
+        self.loss_trace = args.loss_trace
+        self.early_stop_patience = args.early_stop_patience
+        self.early_stop_tol = args.early_stop_tol
+        self.warm_start = args.warm_start
+        self.warm_start_minibatch = args.warm_start_minibatch
+        self.warm_start_iter = args.warm_start_iter
+        self.distill_margin = 0.05
+        # a restart is checkpointed before its warmup, a run resumed from there has to do the warmup first
+        self.needs_warmup = False
+        self.multi_fidelity = getattr(env, 'multi_fidelity', False)
+        # exploration values of the low fidelity only train the surrogate, they never move best_pi
+        self.explore_fidelity = args.explore_fidelity if self.multi_fidelity else 'high'
+
+        if self.resumed:
+            # networks, optimizers, environment and search state come back without any evaluation
+            self.restore_state(self.load_checkpoint(self.checkpoint))
+        else:
+            self.best_pi = self.pi_net.pi.detach().clone()
+            self.best_pi_evaluate = self.step_policy(self.best_pi, to_env=False)
+            self.best_reward = torch.tensor([self.best_pi_evaluate], device=self.device)
+            self.f0 = self.best_pi_evaluate
+
+    def search_state(self):
+        r_norm = {k: v for k, v in vars(self.r_norm).items() if not callable(v)}
+        return {'n': self.frame, 'best_pi': self.best_pi, 'best_reward': self.best_reward,
+                'best_pi_evaluate': self.best_pi_evaluate, 'f0': self.f0, 'divergence': self.divergence,
+                'epsilon': self.epsilon, 'no_change': self.no_change, 'mean_grad': self.mean_grad,
+                'trust_mu': getattr(self.pi_trust_region, 'mu', None),
+                'trust_sigma': getattr(self.pi_trust_region, 'sigma', None),
+                'replay': self.replay.state_dict(),
+                'r_norm': r_norm, 'train_time': self.train_time, 'needs_warmup': self.needs_warmup}
+
+    def restore_state(self, aux):
+        self.frame = aux['n']
+        self.best_pi = aux['best_pi']
+        self.best_reward = aux['best_reward']
+        self.best_pi_evaluate = aux['best_pi_evaluate']
+        self.f0 = aux['f0']
+        self.divergence = aux['divergence']
+        self.epsilon = aux['epsilon']
+        self.no_change = aux['no_change']
+        self.mean_grad = aux['mean_grad']
+        if aux['trust_mu'] is not None:
+            self.pi_trust_region.mu = aux['trust_mu']
+            self.pi_trust_region.sigma = aux['trust_sigma']
+        self.replay.load_state_dict(aux['replay'])
+        vars(self.r_norm).update(aux['r_norm'])
+        self.train_time = aux['train_time']
+        self.needs_warmup = aux['needs_warmup']
+
+    def update_replay_buffer(self, minibatch):
+
+        self.frame += minibatch*self.n_explore
+        explore_policies_rand = self.ball_explore(minibatch*self.n_explore)
 
         self.step_policy(explore_policies_rand)
         rewards_rand = self.env.reward
+        explore_policies_rand = explore_policies_rand[:len(rewards_rand)]
+
+        real_policies = self.pi_trust_region.unconstrained_to_real(explore_policies_rand)
 
         best_explore = rewards_rand.argmin()
-        if self.best_reward > rewards_rand[best_explore]:
-            self.best_pi = self.pi_trust_region.unconstrained_to_real(explore_policies_rand[best_explore].detach().clone())
+        if self.explore_fidelity == 'high' and self.best_reward > rewards_rand[best_explore]:
+            self.best_pi = real_policies[best_explore].detach().clone()
             self.best_reward = rewards_rand[best_explore]
 
-        self.results['explore_policies'].append(self.pi_trust_region.unconstrained_to_real(explore_policies_rand))
+        self.results['explore_policies'].append(real_policies)
         self.results['rewards'].append(rewards_rand)
         self.r_norm(rewards_rand, training=True)
         self.results['norm_rewards'].append(self.r_norm(rewards_rand, training=False))
 
-        self.tensor_replay_reward = torch.cat([self.tensor_replay_reward, rewards_rand])[-self.replay_memory_size:]
-        self.tensor_replay_policy = torch.cat([self.tensor_replay_policy, explore_policies_rand])[-self.replay_memory_size:]
+        self.replay.add(real_policies, rewards_rand)
 
     def results_pi_update_with_explore(self):
 
@@ -88,13 +144,26 @@ class TrustRegionAgent(Agent):
             val = self.r_norm.desquash(self.value_net(self.pi_net.pi.detach()).detach()).cpu().item()
             self.results['IGL'] = val
 
-        self.results['mean_grad'] = self.mean_grad.cpu().numpy()
+        self.results['mean_grad'] = self.mean_grad.cpu().numpy() if self.mean_grad is not None else np.nan
         self.results['divergence'] = self.divergence
         self.results['r_norm_mean'] = self.r_norm.mu.detach().item()
         self.results['r_norm_sigma'] = self.r_norm.sigma.detach().item()
         self.results['min_trust_sigma'] = self.pi_trust_region.sigma.min().item()
         self.results['no_change'] = self.no_change
         self.results['epsilon'] = self.epsilon
+        if self.env.cache is not None:
+            self.results['cache_hits'] = self.env.cache.hits
+            self.results['cache_misses'] = self.env.cache.misses
+        # a compact view of the latency histograms, the full summary is in timing.json
+        timing = self.env.timers.summary()
+        eval_time = timing.get('eval', {})
+        for q in ['p50', 'p95', 'p99']:
+            self.results['time_eval_' + q] = eval_time.get(q, np.nan)
+        self.results['evals_per_sec'] = timing['throughput']['eval_per_sec']
+        self.results['overhead_frac'] = timing['throughput']['overhead']
+        if self.multi_fidelity:
+            self.results['budget_spent'] = self.env.spent
+            self.results['low_fidelity_samples'] = self.env.low_samples
 
         self.save_results()
 
@@ -136,34 +205,108 @@ class TrustRegionAgent(Agent):
                     data = np.hstack([data_np, data])
                 np.save(path, data)
 
-        best_list, observed_list, _ = self.env.get_observed_and_pi_list()
-        np.save(os.path.join(self.analysis_dir, 'best_list_with_explore.npy'), np.array(best_list))
-        np.save(os.path.join(self.analysis_dir, 'observed_list_with_explore.npy'), np.array(best_list))
-
         path = os.path.join(self.analysis_dir, 'f0.npy')
         np.save(path, self.f0)
 
-    def warmup(self):
+        with open(os.path.join(self.analysis_dir, 'timing.json'), 'w') as fh:
+            json.dump(self.env.timers.summary(), fh, indent=2)
+
+    def warmup(self, warm=False):
+        # after a warm restart the surrogate and the reward scale it was trained on are kept,
+        # a few fresh batches and a short fine-tuning are enough
+        self.needs_warmup = False
         self.mean_grad = None
-        self.r_norm.reset()
-        self.update_replay_buffer()
-        self.value_optimize(self.value_iter)
+        if not warm:
+            self.r_norm.reset()
+        self.update_replay_buffer(self.warm_start_minibatch if warm else self.warmup_minibatch)
+        if self.target_reached():
+            return
+        start = time.time()
+        self.value_optimize(self.warm_start_iter if warm else self.value_iter)
+        self.train_time += time.time() - start
+
+    def surrogate(self):
+        if self.algorithm_method == 'EGL':
+            return self.derivative_net, self.optimizer_derivative
+        return self.value_net, self.optimizer_value
+
+    def warm_restart(self):
+        # squeezes the trust region like a cold restart, but the surrogate is carried over into the new
+        # coordinates instead of being reset. The optimizer state, Adam moments included, is kept
+        net, _ = self.surrogate()
+        old_net = copy.deepcopy(net)
+        old_region = copy.copy(self.pi_trust_region)
+        old_region.mu = self.pi_trust_region.mu.clone()
+        old_region.sigma = self.pi_trust_region.sigma.clone()
+        self.update_best_pi()
+        start = time.time()
+        self.distill(old_net, old_region)
+        self.train_time += time.time() - start
+
+    def distill(self, old_net, old_region):
+        # fits the surrogate in the new coordinates u' to the old one at the same real point x. A value
+        # carries over as is, a gradient estimate is g'(u') = g(u) * (dx/du') / (dx/du)
+        net, optimizer = self.surrogate()
+        x = self.replay.policies()
+        # only points well inside both regions: real_to_unconstrained clamps anything outside to the edge,
+        # where the old surrogate is not evaluated at x and dx/du vanishes, so the ratio would blow up
+        inside = torch.ones(len(x), dtype=torch.bool, device=x.device)
+        for region in [old_region, self.pi_trust_region]:
+            inside &= ((x - region.mu).abs() < (1 - self.distill_margin) * region.sigma).all(dim=1)
+        x = x[inside]
+        if not len(x):
+            return
+        u_old = old_region.real_to_unconstrained(x)
+        u_new = self.pi_trust_region.real_to_unconstrained(x)
+        with torch.no_grad():
+            target = old_net(u_old)
+            if self.algorithm_method == 'EGL':
+                ratio = self.pi_trust_region.derivative_unconstrained(u_new) / old_region.derivative_unconstrained(u_old)
+                target = target * ratio
+
+        batch = min(self.max_batch, len(x))
+        net.train()
+        for _ in range(self.warm_start_iter):
+            for index in torch.randperm(len(x), device=self.device).split(batch):
+                optimizer.zero_grad()
+                self.optimizer_pi.zero_grad()
+                loss = self.q_loss(net(u_new[index]), target[index])
+                loss = loss.sum() if self.spline else loss.mean()
+                loss.backward()
+                optimizer.step()
+        net.eval()
+
+    def target_reached(self):
+        return self.target_stop and self.env.t
 
     def save_and_print_results(self):
-        self.save_checkpoint(self.checkpoint, {'n': self.frame})
+        self.save_checkpoint(self.checkpoint, self.search_state())
         self.results_pi_update_with_explore()
 
     def minimize(self):
         counter = -1
-        self.env.reset()
-        self.reset_net()
-        self.warmup()
+        if not self.resumed:
+            self.env.reset()
+            self.reset_net()
+            self.warmup()
+        elif self.needs_warmup:
+            self.warmup(self.warm_start)
         for i in tqdm(itertools.count()):
+            if self.target_reached():
+                # the target was hit during the last evaluation, there is nothing left to train for
+                self.drain_pipeline(cancel=True)
+                self.save_and_print_results()
+                yield self.results
+                print("FINISHED SUCCESSFULLY - FRAME %d" % self.frame)
+                break
+
             counter += 1
             pi_explore, reward = self.exploration_step()
             self.results['explore_policies'].append(self.pi_trust_region.unconstrained_to_real(pi_explore))
             self.results['rewards'].append(reward)
             self.results['norm_rewards'].append(self.r_norm(reward, training=False))
+            if self.target_reached():
+                continue
 
             pi = self.pi_net.pi.detach()
             pi_eval = self.step_policy(pi, to_env=False)
@@ -172,9 +315,6 @@ class TrustRegionAgent(Agent):
             real_pi = self.pi_trust_region.unconstrained_to_real(pi)
             self.results['policies'].append(real_pi)
 
-            self.value_optimize(self.value_iter)
-            self.pi_optimize()
-
             if pi_eval < self.best_pi_evaluate:
                 self.no_change = 0
                 self.best_pi_evaluate = pi_eval
@@ -182,16 +322,29 @@ class TrustRegionAgent(Agent):
                 self.no_change += 1
 
             if pi_eval < self.best_reward:
-                self.best_reward = torch.cuda.FloatTensor(pi_eval)
+                self.best_reward = torch.tensor([pi_eval], device=self.device)
                 self.best_pi = real_pi
 
+            if self.target_reached():
+                continue
+
+            if self.async_staleness:
+                self.fill_pipeline()
+
+            start = time.time()
+            self.value_optimize(self.value_iter)
+            self.pi_optimize()
+            self.train_time += time.time() - start
+
             if self.env.t:
+                self.drain_pipeline()
                 self.save_and_print_results()
                 yield self.results
                 print("FINISHED SUCCESSFULLY - FRAME %d" % self.frame)
                 break
 
-            elif self.frame >= self.budget:
+            elif self.budget_used() >= self.budget:
+                self.drain_pipeline()
                 self.save_and_print_results()
                 yield self.results
                 print("FAILED frame = {}".format(self.frame))
@@ -200,12 +353,23 @@ class TrustRegionAgent(Agent):
             elif counter > self.min_iter and self.no_change > self.trust_region_con:
                 counter = 0
                 self.divergence += 1
-                self.reset_net()
-                self.update_best_pi()
+                self.drain_pipeline()
+                if self.env.t:
+                    # a batch still in flight hit the target, there is nothing left to restart for
+                    self.save_and_print_results()
+                    yield self.results
+                    print("FINISHED SUCCESSFULLY - FRAME %d" % self.frame)
+                    break
+                if self.warm_start:
+                    self.warm_restart()
+                else:
+                    self.reset_net()
+                    self.update_best_pi()
+                self.needs_warmup = True
                 self.save_and_print_results()
                 yield self.results
                 self.reset_result()
-                self.warmup()
+                self.warmup(self.warm_start)
 
             elif (i+1) % self.printing_interval == 0:
                 self.save_and_print_results()
@@ -213,13 +377,18 @@ class TrustRegionAgent(Agent):
                 self.reset_result()
 
     def update_best_pi(self):
+        # the replay buffer is in real coordinates and follows the new trust region without a remap
         pi = self.best_pi.detach().clone()
-        real_replay = self.pi_trust_region.unconstrained_to_real(self.tensor_replay_policy)
         self.pi_trust_region.squeeze(pi)
         self.epsilon *= self.epsilon_factor
         self.epsilon = max(self.epsilon, 1e-4)
         self.pi_net.pi_update(self.pi_trust_region.real_to_unconstrained(pi))
-        self.tensor_replay_policy = self.pi_trust_region.real_to_unconstrained(real_replay)
+        if self.replay_evict > 0:
+            # samples far outside the new region only pile up near +-1 once mapped, they are not trained on
+            mu, sigma = self.pi_trust_region.mu, self.pi_trust_region.sigma
+            lower = torch.clamp(mu - self.replay_evict * sigma, min=-1)
+            upper = torch.clamp(mu + self.replay_evict * sigma, max=1)
+            self.results['replay_evicted'] = self.replay.evict(lower, upper, self.n_explore)
 
     def pi_optimize(self):
 
@@ -236,24 +405,78 @@ class TrustRegionAgent(Agent):
 
     def value_optimize(self, value_iter):
 
-        self.tensor_replay_reward_norm = self.r_norm(self.tensor_replay_reward)
-        self.tensor_replay_policy_norm = self.tensor_replay_policy
+        self.tensor_replay_reward_norm = self.r_norm(self.replay.rewards())
 
         len_replay_buffer = len(self.tensor_replay_reward_norm)
+        # with early stopping the newest exploration group is held out of training to validate on
+        self.holdout = None
+        if self.early_stop_patience and len_replay_buffer > self.n_explore:
+            self.holdout = self.replay.newest_group(self.n_explore)
+            len_replay_buffer -= self.n_explore
+        self.holdout_best = np.inf
+        self.holdout_wait = 0
+        self.epochs_used = value_iter
+
         self.batch = min(self.max_batch, len_replay_buffer)
         minibatches = len_replay_buffer // self.batch
 
+        start = time.time()
         self.value_optimize_method(len_replay_buffer, minibatches, value_iter)
+        elapsed = time.time() - start
+        self.results['epochs'].append(self.epochs_used)
+        self.results['train_time_saved'].append(elapsed / self.epochs_used * (value_iter - self.epochs_used))
+
+    def stop_training(self, epochs):
+        # called at the end of every epoch, stops after early_stop_patience epochs without a
+        # relative improvement of early_stop_tol on the held-out group
+        self.epochs_used = epochs
+        if self.holdout is None:
+            return False
+        loss = self.holdout_loss()
+        if loss < self.holdout_best * (1 - self.early_stop_tol):
+            self.holdout_best = loss
+            self.holdout_wait = 0
+        else:
+            self.holdout_wait += 1
+        return self.holdout_wait >= self.early_stop_patience
+
+    def holdout_loss(self):
+        index = torch.arange(self.holdout, self.holdout + self.n_explore, device=self.device)
+        with torch.no_grad():
+            pi = self.replay.gather(index, self.pi_trust_region)
+            r = self.tensor_replay_reward_norm[index]
+            if self.algorithm_method == 'IGL':
+                return self.q_loss(self.value_net(pi).flatten(), r).mean().item()
+            # every pair of the group, as in EGL_all_pairs_optimize without the perturbation
+            g = self.derivative_net(pi)
+            value = g @ pi.t() - (pi * g).sum(dim=1, keepdim=True)
+            target = r.unsqueeze(0) - r.unsqueeze(1)
+            return self.q_loss(value, target).mean().item()
+
+    def track_loss(self, loss, trace, step, loss_q):
+        # the running sum stays on the device, nothing here waits for the step to finish
+        loss += loss_q.detach()
+        if self.loss_trace and step % self.loss_trace == 0:
+            trace.append(loss_q.detach())
+
+    def read_loss(self, loss, trace, name):
+        # the single synchronisation of a value_optimize call, the sampled losses of every call are kept
+        if trace:
+            self.results[name].extend(torch.stack(trace).cpu().tolist())
+        return loss.item() / self.epochs_used
 
     def IGL_method_optimize(self, len_replay_buffer, minibatches, value_iter):
-        loss = 0
+        loss = torch.zeros((), device=self.device)
+        trace = []
         self.value_net.train()
-        for _ in range(value_iter):
+        for epoch in range(value_iter):
             shuffle_indexes = np.random.choice(len_replay_buffer, (minibatches, self.batch), replace=False)
+            if self.holdout is not None:
+                shuffle_indexes += self.n_explore * (shuffle_indexes >= self.holdout)
             for i in range(minibatches):
                 samples = shuffle_indexes[i]
                 r = self.tensor_replay_reward_norm[samples]
-                pi_explore = self.tensor_replay_policy_norm[samples]
+                pi_explore = self.replay.gather(samples, self.pi_trust_region)
 
                 self.optimizer_value.zero_grad()
                 self.optimizer_pi.zero_grad()
@@ -262,20 +485,22 @@ class TrustRegionAgent(Agent):
                     loss_q = self.q_loss(q_value, r).sum()
                 else:
                     loss_q = self.q_loss(q_value, r).mean()
-                loss += loss_q.detach().item()
+                self.track_loss(loss, trace, epoch * minibatches + i, loss_q)
                 loss_q.backward()
                 self.optimizer_value.step()
 
-        loss /= value_iter
-        self.results['value_loss'].append(loss)
+            if self.stop_training(epoch + 1):
+                break
+
+        self.results['value_loss'].append(self.read_loss(loss, trace, 'value_loss_trace'))
         self.value_net.eval()
 
     def ball_perturb(self, pi, eps):
 
         n_explore = len(pi)
 
-        x = torch.cuda.FloatTensor(n_explore, self.action_space).normal_()
-        mag = torch.cuda.FloatTensor(n_explore, 1).uniform_()
+        x = torch.randn(n_explore, self.action_space, device=self.device)
+        mag = torch.rand(n_explore, 1, device=self.device)
 
         x = x / (torch.norm(x, dim=1, keepdim=True) + 1e-8)
 
@@ -285,67 +510,154 @@ class TrustRegionAgent(Agent):
 
     def EGL_method_optimize(self, len_replay_buffer, minibatches, value_iter):
 
-        loss = 0
+        loss = torch.zeros((), device=self.device)
+        trace = []
         self.derivative_net.train()
-        for _ in range(value_iter):
-            anchor_indexes = np.random.choice(len_replay_buffer, (minibatches, self.batch), replace=False)
-            ref_indexes = np.random.randint(0, self.n_explore, size=(minibatches, self.batch))
-            explore_indexes = anchor_indexes // self.n_explore
+        # all value_iter epochs are sampled up front on the device, a step is one gather of [anchors, references]
+        indexes = self.replay.sample_pairs(value_iter, minibatches, self.batch, self.n_explore, self.holdout)
+        for step, index in enumerate(indexes):
+            pi_1, pi_2 = self.replay.gather(index, self.pi_trust_region).split(self.batch)
+            r_1, r_2 = self.tensor_replay_reward_norm[index].split(self.batch)
+            pi_1_perturb = self.ball_perturb(pi_1, eps=self.epsilon*self.pertub)
 
-            for i, anchor_index in enumerate(anchor_indexes):
-                ref_index = torch.LongTensor(self.n_explore * explore_indexes[i] + ref_indexes[i])
+            pi_tag_1 = self.derivative_net(pi_1_perturb)
 
-                r_1 = self.tensor_replay_reward_norm[anchor_index]
-                r_2 = self.tensor_replay_reward_norm[ref_index]
-                pi_1 = self.tensor_replay_policy_norm[anchor_index]
-                pi_1_perturb = self.ball_perturb(pi_1, eps=self.epsilon*self.pertub)
+            value = ((pi_2 - pi_1) * pi_tag_1).sum(dim=1)
+            target = (r_2 - r_1)
 
-                pi_2 = self.tensor_replay_policy_norm[ref_index]
-                pi_tag_1 = self.derivative_net(pi_1_perturb)
+            self.optimizer_derivative.zero_grad()
+            self.optimizer_pi.zero_grad()
+            if self.spline:
+                loss_q = self.q_loss(value, target).sum()
+            else:
+                loss_q = self.q_loss(value, target).mean()
 
-                value = ((pi_2 - pi_1) * pi_tag_1).sum(dim=1)
-                target = (r_2 - r_1)
+            self.track_loss(loss, trace, step, loss_q)
+            loss_q.backward()
+            self.optimizer_derivative.step()
 
-                self.optimizer_derivative.zero_grad()
-                self.optimizer_pi.zero_grad()
-                if self.spline:
-                    loss_q = self.q_loss(value, target).sum()
-                else:
-                    loss_q = self.q_loss(value, target).mean()
+            if (step + 1) % minibatches == 0 and self.stop_training((step + 1) // minibatches):
+                break
 
-                loss += loss_q.detach().item()
-                loss_q.backward()
-                self.optimizer_derivative.step()
+        self.results['derivative_loss'] = self.read_loss(loss, trace, 'derivative_loss_trace')
+        self.derivative_net.eval()
+
+    def EGL_all_pairs_optimize(self, len_replay_buffer, minibatches, value_iter):
 
-        loss /= value_iter
-        self.results['derivative_loss'] = loss
+        # every (i, j) pair of an exploration group: (pi_j - pi_i) . g(pi_i) against r_j - r_i,
+        # a forward pass over the n rows of a group trains on n * (n - 1) pairs
+        n = self.n_explore
+        groups = max(self.batch // n, 1)
+        pairs = n - 1 if self.egl_topk <= 0 else min(self.egl_topk, n - 1)
+        eye = torch.eye(n, dtype=torch.bool, device=self.device)
+
+        loss = torch.zeros((), device=self.device)
+        trace = []
+        self.derivative_net.train()
+        indexes = self.replay.sample_groups(value_iter, groups, n, self.holdout)
+        steps = len(indexes) // value_iter
+        for step, index in enumerate(indexes):
+            pi = self.replay.gather(index, self.pi_trust_region).view(groups, n, -1)
+            r = self.tensor_replay_reward_norm[index].view(groups, n)
+            pi_tag = self.derivative_net(self.ball_perturb(pi.view(groups * n, -1), eps=self.epsilon*self.pertub))
+            pi_tag = pi_tag.view(groups, n, -1)
+
+            # value[b, i, j] = pi_j . g_i - pi_i . g_i
+            value = torch.bmm(pi_tag, pi.transpose(1, 2)) - (pi * pi_tag).sum(dim=2, keepdim=True)
+            target = r.unsqueeze(1) - r.unsqueeze(2)
+
+            if pairs < n - 1:
+                dist = torch.cdist(pi, pi).masked_fill(eye, float('inf'))
+                mask = torch.zeros_like(eye).expand(groups, n, n).clone()
+                mask.scatter_(2, dist.topk(pairs, dim=2, largest=False).indices, True)
+            else:
+                mask = ~eye.expand(groups, n, n)
+
+            self.optimizer_derivative.zero_grad()
+            self.optimizer_pi.zero_grad()
+            # masked by multiplication, a boolean gather would wait for the device on every step
+            loss_q = (self.q_loss(value, target) * mask).sum()
+            if self.spline:
+                # per anchor the same scale as a single reference
+                loss_q = loss_q / pairs
+            else:
+                loss_q = loss_q / (groups * n * pairs)
+
+            self.track_loss(loss, trace, step, loss_q)
+            loss_q.backward()
+            self.optimizer_derivative.step()
+
+            if (step + 1) % steps == 0 and self.stop_training((step + 1) // steps):
+                break
+
+        self.results['derivative_loss'] = self.read_loss(loss, trace, 'derivative_loss_trace')
         self.derivative_net.eval()
 
+    def budget_used(self):
+        # requested evaluations, or cost units when the environment has several fidelities
+        return self.env.spent if self.multi_fidelity else self.frame
+
+    def set_fidelity(self):
+        if self.multi_fidelity:
+            self.env.fidelity = self.explore_fidelity
+
     def step_policy(self, policy, to_env=True):
         policy = self.pi_trust_region.unconstrained_to_real(policy)
+        self.env.frame = self.frame
         if to_env:
+            self.set_fidelity()
             self.env.step_policy(policy)
         else:
             return self.env.f(policy)
 
+    def submit_exploration(self):
+        pi_explore = self.exploration(self.n_explore)
+        self.set_fidelity()
+        batch = self.env.submit_policy(self.pi_trust_region.unconstrained_to_real(pi_explore))
+        self.pending.append((pi_explore, batch))
+
+    def fill_pipeline(self):
+        # batches are generated around the current pi and evaluated while the surrogate trains,
+        # so a batch is consumed at most async_staleness pi updates after it was generated
+        while len(self.pending) < self.async_staleness:
+            self.submit_exploration()
+
+    def drain_pipeline(self, cancel=False):
+        # in-flight batches belong to the old trust region, account for their evaluations and drop them
+        while self.pending:
+            _, batch = self.pending.popleft()
+            if cancel and self.env.cancel_policy(batch):
+                continue
+            self.frame += self.n_explore
+            self.env.frame = self.frame
+            self.env.complete_policy(batch)
+
     def exploration_step(self):
         self.frame += self.n_explore
-        pi_explore = self.exploration(self.n_explore)
-        self.step_policy(pi_explore)
+        if self.async_staleness:
+            if not self.pending:
+                self.submit_exploration()
+            pi_explore, batch = self.pending.popleft()
+            self.env.frame = self.frame
+            self.env.collect_policy(batch)
+        else:
+            pi_explore = self.exploration(self.n_explore)
+            self.step_policy(pi_explore)
         rewards = self.env.reward
+        # shorter than the batch when the target was hit inside it
+        pi_explore = pi_explore[:len(rewards)]
 
         best_explore = rewards.argmin()
         if self.best_explore_update:
             self.pi_net.pi_update(pi_explore[best_explore])
 
-        if self.best_reward > rewards[best_explore]:
+        if self.explore_fidelity == 'high' and self.best_reward > rewards[best_explore]:
             self.best_pi = self.pi_trust_region.unconstrained_to_real(pi_explore[best_explore].detach().clone())
             self.best_reward = rewards[best_explore]
 
         self.r_norm(rewards, training=True)
 
-        self.tensor_replay_reward = torch.cat([self.tensor_replay_reward, rewards])[-self.replay_memory_size:]
-        self.tensor_replay_policy = torch.cat([self.tensor_replay_policy, pi_explore])[-self.replay_memory_size:]
+        self.replay.add(self.pi_trust_region.unconstrained_to_real(pi_explore), rewards)
 
         return pi_explore, rewards
 
@@ -363,10 +675,10 @@ class TrustRegionAgent(Agent):
         for i in range(0, policy.shape[0], batch):
             from_index = i
             to_index = min(i + batch, policy.shape[0])
-            policy_tensor = torch.cuda.FloatTensor(policy[from_index:to_index])
+            policy_tensor = torch.as_tensor(policy[from_index:to_index], dtype=torch.float, device=self.device)
             policy_tensor = self.pi_trust_region.real_to_unconstrained(policy_tensor)
             policy_tensor = autograd.Variable(policy_tensor, requires_grad=True)
-            target_tensor = torch.cuda.FloatTensor(target[from_index:to_index])
+            target_tensor = target[from_index:to_index].to(self.device)
             q_value = self.value_net(policy_tensor).view(-1)
             value.append(q_value.detach().cpu().numpy())
 
@@ -375,7 +687,7 @@ class TrustRegionAgent(Agent):
             else:
                 loss_q = self.q_loss(q_value, target_tensor).mean()
 
-            grads = autograd.grad(outputs=loss_q, inputs=policy_tensor, grad_outputs=torch.cuda.FloatTensor(loss_q.size()).fill_(1.),
+            grads = autograd.grad(outputs=loss_q, inputs=policy_tensor, grad_outputs=torch.ones_like(loss_q),
                                       create_graph=True, retain_graph=True, only_inputs=True)[0].detach()
             grads_norm.append(torch.norm(torch.clamp(grads.view(-1, self.action_space), -1, 1), p=2, dim=1).cpu().numpy())
 
@@ -394,7 +706,7 @@ class TrustRegionAgent(Agent):
 
         f = torch.FloatTensor(f)
         self.derivative_net.eval()
-        policy_tensor = torch.cuda.FloatTensor(policy)
+        policy_tensor = torch.as_tensor(policy, dtype=torch.float, device=self.device)
         policy_tensor = self.pi_trust_region.real_to_unconstrained(policy_tensor)
         policy_diff = policy_tensor[1:]-policy_tensor[:-1]
         policy_diff_norm = policy_diff / (torch.norm(policy_diff, p=2, dim=1, keepdim=True) + 1e-5)
@@ -7,7 +7,7 @@ from torchvision import datasets, transforms
 from torchvision.utils import save_image
 import os
 import pwd
-import cocoex
+from bbob import make_suite
 import numpy as np
 from config import args
 import pathlib
@@ -73,7 +73,7 @@ class VaeModel(object):
     def __init__(self, vae_mode):
         root_dir = consts.vaedir
         self.vae_mode = vae_mode
-        is_cuda = torch.cuda.is_available()
+        is_cuda = not args.no_cuda and torch.cuda.is_available()
         torch.manual_seed(128)
         self.device = torch.device("cuda" if is_cuda else "cpu")
         kwargs = {'num_workers': 1, 'pin_memory': True} if is_cuda else {}
@@ -111,7 +111,7 @@ class VaeModel(object):
         if not os.path.exists(self.model_path):
             assert False, "load_model"
 
-        state = torch.load(self.model_path)
+        state = torch.load(self.model_path, map_location=self.device)
 
         self.model = state['model'].to(self.device)
         self.optimizer.load_state_dict(state['optimizer'])
@@ -175,9 +175,7 @@ class VaeProblem(object):
         self.vae.model.eval()
         self.problem = None
 
-        suite_name = "bbob"
-        suite_filter_options = ("dimensions: " + str(self.latent))
-        self.suite = cocoex.Suite(suite_name, "", suite_filter_options)
+        self.suite = make_suite(self.latent)
         self.reset(problem_index)
 
     def reset(self, problem_index):
@@ -216,19 +214,25 @@ class VaeProblem(object):
         return policy
 
     def func(self, x):
-        z, _, _, _ = self.vae.model(x.unsqueeze(0), 'enc')
-        z = z.detach().cpu().numpy()
-        #z = self.denormalize(z).flatten()
-        z = np.clip(z.flatten(), a_min=self.z_lower_bounds, a_max=self.z_upper_bounds)
-        f_val = self.problem(z)
+        return float(self.func_batch(x.unsqueeze(0))[0])
+
+    def func_batch(self, x):
+        # a single encoder pass for the whole batch, then the latent problem on all rows at once
+        with torch.no_grad():
+            z, _, _, _ = self.vae.model(x.reshape(-1, self.dimension), 'enc')
+        z = np.clip(z.cpu().numpy(), a_min=self.z_lower_bounds, a_max=self.z_upper_bounds)
+        batch = getattr(self.problem, 'batch', None)
+        if batch is not None:
+            f_val = np.asarray(batch(z), dtype=np.float64)
+        else:
+            f_val = np.fromiter((self.problem(zi) for zi in z), dtype=np.float64, count=len(z))
 
         self.best_observed_fvalue1 = self.problem.best_observed_fvalue1
-        self.evaluations += 1
+        self.evaluations += len(f_val)
         self.final_target_hit = self.problem.final_target_hit
 
         return f_val
 
-
 if __name__ == "__main__":
     vae = VaeModel(args.vae)
     vae.run_vae()
@@ -0,0 +1,91 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+from config import args, DirsAndLocksSingleton
+from evaluator import CocoProblemFactory
+from environment import EnvCoco, VecEnv
+
+# lockstep baseline over many problems: a (mu/mu, lambda) evolution strategy with a success rule for the
+# step size, one mean per problem, all problems sampled and evaluated together through VecEnv, e.g.
+#   python vec_search.py --bbob-backend native --start 0 --stop 360 --filter 15 --n-explore 64
+
+SIGMA0 = 0.3
+SIGMA_UP = 1.5
+SIGMA_DOWN = 0.9
+
+
+def make_envs(dimension, problems):
+    envs = []
+    for problem_index in problems:
+        # every problem gets its own suite, the problems of one cocoex suite are not meant to be open together
+        _, problem = CocoProblemFactory(dimension, problem_index)()
+        envs.append(EnvCoco(problem, problem_index, need_norm=True, to_numpy=True))
+    return envs
+
+
+def normalize(env, x):
+    return 2 * (x - env.lower_bounds) / (env.upper_bounds - env.lower_bounds) - 1
+
+
+def vec_search(vec, n_explore):
+    K = vec.n_envs
+    mean = torch.tensor(np.stack([normalize(env, env.get_initial_solution()) for env in vec.envs]),
+                        dtype=torch.float)
+    D = mean.shape[1]
+    mu = max(n_explore // 4, 1)
+    sigma = torch.full((K,), SIGMA0)
+    best = torch.from_numpy(vec.f(mean).astype(np.float32))
+
+    while not vec.done.all():
+        x = torch.clamp(mean.unsqueeze(1) + sigma.view(-1, 1, 1) * torch.randn(K, n_explore, D), -1, 1)
+        reward = vec.step_policy(x).cpu()
+        # rows of finished problems and rows cut by the budget or the target are nan
+        reward = torch.where(torch.isnan(reward), torch.full_like(reward, np.inf), reward)
+        elite = reward.argsort(dim=1)[:, :mu]
+        elite_mean = x.gather(1, elite.unsqueeze(2).expand(-1, -1, D)).mean(dim=1)
+
+        batch_best = reward.min(dim=1)[0]
+        success = batch_best < best
+        best = torch.min(best, batch_best)
+        sigma = torch.clamp(sigma * torch.where(success, torch.full_like(sigma, SIGMA_UP),
+                                                torch.full_like(sigma, SIGMA_DOWN)), 1e-8, 1.)
+
+        active = torch.from_numpy(~vec.done).unsqueeze(1)
+        mean = torch.where(active, elite_mean, mean)
+        if not vec.done.all():
+            vec.f(mean)
+
+
+def main():
+    exp_name = "vec_search_%s_%s" % (args.identifier, str(args.action_space))
+    problems = [args.problem_index] if args.problem_index != -1 else range(args.start, args.stop, args.filter)
+    vec = VecEnv(make_envs(max(args.action_space, 2), problems))
+
+    start = time.time()
+    try:
+        vec_search(vec, args.n_explore)
+    finally:
+        vec.close()
+    wall_time = time.time() - start
+
+    df = pd.DataFrame({'index': vec.get_problem_index(),
+                       'id': vec.get_problem_id(),
+                       'hit': vec.t,
+                       'evaluations': vec.samples,
+                       'best_observed': vec.best_observed,
+                       'time_to_target': [env.hit_time - start if env.hit_time is not None else np.nan
+                                          for env in vec.envs]})
+    print("backend {} | problems {} | wall {:.2f}s | evaluations/s {:.1f}".format(
+        args.bbob_backend, len(df), wall_time, df['evaluations'].sum() / wall_time))
+    print("solved {}/{} | median time to target {:.2f}s".format(
+        int(df['hit'].sum()), len(df), df['time_to_target'].median()))
+
+    path = os.path.join(DirsAndLocksSingleton(exp_name).root, 'vec_search.csv')
+    df.to_csv(path, index=False)
+    print("saved to {}".format(path))
+
+
+if __name__ == '__main__':
+    main()
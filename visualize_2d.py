@@ -7,8 +7,6 @@ plt.style.use('seaborn-deep')
 import matplotlib.ticker as mtick
 
 import torch
-try: import cocoex
-except: pass
 
 try: import cma
 except: pass
@@ -22,7 +20,8 @@ from tqdm import tqdm
 from collections import defaultdict
 from vae import VaeProblem, VAE
 from environment import EnvCoco, EnvOneD, EnvVae
-from environment import one_d_change_dim
+from environment import one_d_change_dim, load_best_list
+from bbob import make_suite, evaluate_points
 import pickle
 username = pwd.getpwuid(os.geteuid()).pw_name
 from config import Consts
@@ -63,9 +62,7 @@ def compare_problem_baseline(dim, index, budget=1000, sub_budget=100):
     if dim == 784:
         problem = VaeProblem(index)
     else:
-        suite_name = "bbob"
-        suite_filter_options = ("dimensions: "+str(max(dim, 2)))
-        suite = cocoex.Suite(suite_name, "", suite_filter_options)
+        suite = make_suite(max(dim, 2))
 
     data = defaultdict(list)
     for alg, fmin in optimization_function.items():
@@ -201,19 +198,15 @@ def create_copy_file(prefix, dim, index):
 
 
 def treeD_plot(problem_index):
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(problem_index)
     upper_bound = problem.upper_bounds
     lower_bound = problem.lower_bounds
     interval = 0.001
-    res_list = []
-    for x0 in np.arange(lower_bound[0], upper_bound[0]+interval, interval):
-        for x1 in np.arange(lower_bound[1], upper_bound[1]+interval, interval):
-            x = np.array([x0, x1])
-            fx = problem(x)
-            res_list.append(np.concatenate([x, fx], axis=None))
-
-    res = np.stack(res_list)
+    x0, x1 = np.meshgrid(np.arange(lower_bound[0], upper_bound[0]+interval, interval),
+                         np.arange(lower_bound[1], upper_bound[1]+interval, interval), indexing='ij')
+    x = np.stack([x0.ravel(), x1.ravel()], axis=1)
+    res = np.concatenate([x, evaluate_points(problem, x)[:, None]], axis=1)
     res_dir = os.path.join(Consts.baseline_dir, 'f_eval', '2D')
     if not os.path.exists(res_dir):
         try:
@@ -228,7 +221,7 @@ def calc_f0():
     save_dir = Consts.baseline_dir
     data_dict = defaultdict(list)
     for dim in [2,3,5,10,20,40]:
-        suite = cocoex.Suite("bbob", "", ("dimensions: {}".format(dim)))
+        suite = make_suite(dim)
 
         for problem_index in range (360):
             problem = suite.get_problem(problem_index)
@@ -241,7 +234,7 @@ def calc_f0():
 
 
 def treeD_plot_contour(problem_index):
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(problem_index)
     upper_bound = problem.upper_bounds
     lower_bound = problem.lower_bounds
@@ -250,12 +243,7 @@ def treeD_plot_contour(problem_index):
     x0 = np.arange(lower_bound[0], upper_bound[0] + interval, interval)
     x1 = np.arange(lower_bound[1], upper_bound[1] + interval, interval)
     x0, x1 = np.meshgrid(x0, x1)
-    z = np.zeros(x0.shape)
-
-    for i in range(x0.shape[0]):
-        for j in range(x1.shape[1]):
-            x = np.array([x0[i,j], x1[i,j]])
-            z[i,j] = problem(x)
+    z = evaluate_points(problem, np.stack([x0.ravel(), x1.ravel()], axis=1)).reshape(x0.shape)
 
     res_dir = os.path.join(Consts.baseline_dir, 'f_eval', '2D_Contour')
     if not os.path.exists(res_dir):
@@ -270,7 +258,7 @@ def treeD_plot_contour(problem_index):
 
 
 def D1_plot(problem_index):
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(problem_index)
 
     upper_bound = problem.upper_bounds
@@ -279,11 +267,9 @@ def D1_plot(problem_index):
 
     x0 = np.arange(-1, 1 + interval, interval)
     norm_policy = np.clip(one_d_change_dim(x0), -1, 1)
-    f = np.zeros(x0.shape)
     policy = 0.5 * (norm_policy + 1) * (upper_bound - lower_bound) + lower_bound
 
-    for i in range(x0.shape[0]):
-        f[i] = problem(policy[i])
+    f = evaluate_points(problem, policy)
 
     res_dir = os.path.join(Consts.baseline_dir, 'f_eval', '1D')
     if not os.path.exists(res_dir):
@@ -294,7 +280,7 @@ def D1_plot(problem_index):
         pickle.dump({'norm_policy':norm_policy, 'policy':policy, 'f':f}, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
 def nD_plot(dim, problem_index):
-    suite = cocoex.Suite("bbob", "", ("dimensions: {}".format(dim)))
+    suite = make_suite(dim)
     problem = suite.get_problem(problem_index)
 
     upper_bound = problem.upper_bounds
@@ -303,11 +289,9 @@ def nD_plot(dim, problem_index):
 
     norm_policy = np.arange(-1, 1 + interval, interval).reshape(-1,1)
     norm_policy = np.repeat(norm_policy, dim, axis=1)
-    f = np.zeros(norm_policy.shape[0])
     policy = 0.5 * (norm_policy + 1) * (upper_bound - lower_bound) + lower_bound
 
-    for i in range(policy.shape[0]):
-        f[i] = problem(policy[i])
+    f = evaluate_points(problem, policy)
 
     res_dir = os.path.join(Consts.baseline_dir, 'f_eval', '{}D'.format(dim))
     if not os.path.exists(res_dir):
@@ -323,7 +307,7 @@ def nD_plot(dim, problem_index):
 
 
 def visualization(problem_index):
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(problem_index)
     upper_bound = problem.upper_bounds
     lower_bound = problem.lower_bounds
@@ -343,37 +327,22 @@ def visualization(problem_index):
     x0 = np.arange(lower_bound[0], upper_bound[0] + interval, interval)
     x1 = np.arange(lower_bound[1], upper_bound[1] + interval, interval)
     x0, x1 = np.meshgrid(x0, x1)
-    z = np.zeros(x0.shape)
-
-    for i in range(x0.shape[0]):
-        for j in range(x1.shape[1]):
-            x = np.array([x0[i, j], x1[i, j]])
-            z[i, j] = problem(x)
+    z = evaluate_points(problem, np.stack([x0.ravel(), x1.ravel()], axis=1)).reshape(x0.shape)
 
     ax1.contour(x0, x1, z, 100)
 
-    f_list = []
-    x_list = []
-    for x0 in np.arange(lower_bound[0], upper_bound[0] + interval, interval):
-        for x1 in np.arange(lower_bound[1], upper_bound[1] + interval, interval):
-            x = np.array([x0, x1])
-            fx = problem(x)
-            f_list.append(fx)
-            x_list.append(x)
-
-    f_list = np.array(f_list)
-    x_list = np.array(x_list)
+    x0, x1 = np.meshgrid(np.arange(lower_bound[0], upper_bound[0] + interval, interval), np.arange(lower_bound[1], upper_bound[1] + interval, interval), indexing='ij')
+    x_list = np.stack([x0.ravel(), x1.ravel()], axis=1)
+    f_list = evaluate_points(problem, x_list)
     #ax2 = fig.gca(projection='3d')
     ax2.plot_trisurf(x_list[:, 0], x_list[:, 1], f_list, cmap='winter')
 
     interval = 0.0001
     x0 = np.arange(-1, 1 + interval, interval)
     norm_policy = np.clip(one_d_change_dim(x0), -1, 1)
-    f = np.zeros(x0.shape)
     policy = 0.5 * (norm_policy + 1) * (upper_bound - lower_bound) + lower_bound
 
-    for i in range(x0.shape[0]):
-        f[i] = problem(policy[i])
+    f = evaluate_points(problem, policy)
 
     ax3.plot(policy, f, color='g', markersize=2, linewidth=4, label='f')
     ax3.set_xlabel('x')
@@ -468,7 +437,7 @@ def avg_dim_best_observed(dim, save_file, alg_name_list, prefix_list, with_op=Fa
                 tmp_id = []
                 for id in dir_index:
                     try:
-                        _ = np.load(os.path.join(compare_dirs[alg], id, 'best_list_with_explore.npy'), allow_pickle=True)
+                        _ = load_best_list(os.path.join(compare_dirs[alg], id))
                     except:
                         continue
                     tmp_id.append(id)
@@ -484,7 +453,7 @@ def avg_dim_best_observed(dim, save_file, alg_name_list, prefix_list, with_op=Fa
 
         for key, path in compare_dirs.items():
             try:
-                pi_best = np.load(os.path.join(path, index, 'best_list_with_explore.npy'),  allow_pickle=True)
+                pi_best = load_best_list(os.path.join(path, index))
                 min_val = min(min_val, pi_best.min())
             except:
                 pass
@@ -505,7 +474,7 @@ def avg_dim_best_observed(dim, save_file, alg_name_list, prefix_list, with_op=Fa
 
         for key in alg_name_list:
             try:
-                pi_best = np.load(os.path.join(compare_dirs[key], index, 'best_list_with_explore.npy'),  allow_pickle=True)
+                pi_best = load_best_list(os.path.join(compare_dirs[key], index))
                 pi_best = np.clip(pi_best, a_max=f0, a_min=min_val)
                 pi_best = pi_best[:max_len]
                 pi_best = np.concatenate([pi_best, pi_best[-1] * np.ones(max_len - len(pi_best))])
@@ -614,7 +583,7 @@ def avg_perturb_best_observed(dim, save_file, div_name,alg_name_list, prefix_lis
                 tmp_id = []
                 for id in dir_index:
                     try:
-                        _ = np.load(os.path.join(compare_dirs[alg], id, 'best_list_with_explore.npy'), allow_pickle=True)
+                        _ = load_best_list(os.path.join(compare_dirs[alg], id))
                     except:
                         continue
                     tmp_id.append(id)
@@ -630,13 +599,13 @@ def avg_perturb_best_observed(dim, save_file, div_name,alg_name_list, prefix_lis
 
         for key, path in compare_dirs.items():
             try:
-                pi_best = np.load(os.path.join(path, index, 'best_list_with_explore.npy'),  allow_pickle=True)
+                pi_best = load_best_list(os.path.join(path, index))
                 min_val = min(min_val, pi_best.min())
             except:
                 pass
         for key, path in div_dirs.items():
             try:
-                pi_best = np.load(os.path.join(path, index, 'best_list_with_explore.npy'),  allow_pickle=True)
+                pi_best = load_best_list(os.path.join(path, index))
                 min_val = min(min_val, pi_best.min())
             except:
                 pass
@@ -644,7 +613,7 @@ def avg_perturb_best_observed(dim, save_file, div_name,alg_name_list, prefix_lis
         min_val -= 1e-5
         for key in alg_name_list:
             try:
-                pi_best = np.load(os.path.join(compare_dirs[key], index, 'best_list_with_explore.npy'),  allow_pickle=True)
+                pi_best = load_best_list(os.path.join(compare_dirs[key], index))
                 pi_best = np.clip(pi_best, a_max=f0, a_min=min_val)
                 pi_best = pi_best[:max_len]
                 pi_best = np.concatenate([pi_best, pi_best[-1] * np.ones(max_len - len(pi_best))])
@@ -728,7 +697,7 @@ def dim_plot(kk, alg_name_list, prefix_list, with_op, ax):
                 tmp_id = []
                 for id in dir_index:
                     try:
-                        _ = np.load(os.path.join(compare_dirs[alg], id, 'best_list_with_explore.npy'), allow_pickle=True)
+                        _ = load_best_list(os.path.join(compare_dirs[alg], id))
                     except:
                         continue
                     tmp_id.append(id)
@@ -743,7 +712,7 @@ def dim_plot(kk, alg_name_list, prefix_list, with_op, ax):
         f0 = optimizer_res['f0'][0]
 
         for key, path in compare_dirs.items():
-            pi_best = np.load(os.path.join(path, index, 'best_list_with_explore.npy'), allow_pickle=True)
+            pi_best = load_best_list(os.path.join(path, index))
             min_val = min(min_val, pi_best.min())
 
         min_val -= 1e-5
@@ -762,7 +731,7 @@ def dim_plot(kk, alg_name_list, prefix_list, with_op, ax):
 
         for key in alg_name_list:
             try:
-                pi_best = np.load(os.path.join(compare_dirs[key], index, 'best_list_with_explore.npy'), allow_pickle=True)
+                pi_best = load_best_list(os.path.join(compare_dirs[key], index))
                 pi_best = np.clip(pi_best, a_max=f0, a_min=min_val)
                 pi_best = pi_best[:max_len]
                 pi_best = np.concatenate([pi_best, pi_best[-1] * np.ones(max_len - len(pi_best))])
@@ -803,7 +772,7 @@ def dim_plot(kk, alg_name_list, prefix_list, with_op, ax):
 
 def _2d_plot(index, ax):
 
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(15*index)
     upper_bound = problem.upper_bounds
     lower_bound = problem.lower_bounds
@@ -812,12 +781,7 @@ def _2d_plot(index, ax):
     x0 = np.arange(lower_bound[0], upper_bound[0] + interval, interval)
     x1 = np.arange(lower_bound[1], upper_bound[1] + interval, interval)
     x0, x1 = np.meshgrid(x0, x1)
-    z = np.zeros(x0.shape)
-
-    for k in range(x0.shape[0]):
-        for j in range(x1.shape[1]):
-            x = np.array([x0[k, j], x1[k, j]])
-            z[k, j] = problem(x)
+    z = evaluate_points(problem, np.stack([x0.ravel(), x1.ravel()], axis=1)).reshape(x0.shape)
 
     min_val = z.min()
     z -= min_val - 1e-3
@@ -832,23 +796,15 @@ def _2d_plot(index, ax):
 
 def _3d_plot(index, ax):
 
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(15*index)
     upper_bound = problem.upper_bounds
     lower_bound = problem.lower_bounds
     interval = 0.1
 
-    f_list = []
-    x_list = []
-    for x0 in np.arange(lower_bound[0], upper_bound[0] + interval, interval):
-        for x1 in np.arange(lower_bound[1], upper_bound[1] + interval, interval):
-            x = np.array([x0, x1])
-            fx = problem(x)
-            f_list.append(fx)
-            x_list.append(x)
-
-    f_list = np.array(f_list)
-    x_list = np.array(x_list)
+    x0, x1 = np.meshgrid(np.arange(lower_bound[0], upper_bound[0] + interval, interval), np.arange(lower_bound[1], upper_bound[1] + interval, interval), indexing='ij')
+    x_list = np.stack([x0.ravel(), x1.ravel()], axis=1)
+    f_list = evaluate_points(problem, x_list)
 
     ax.plot_trisurf(x_list[:, 0], x_list[:, 1], f_list, cmap='winter')
     ax.set_xticklabels([])
@@ -857,7 +813,7 @@ def _3d_plot(index, ax):
 
 def _1d_plot(index, ax):
 
-    suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+    suite = make_suite(2)
     problem = suite.get_problem(15*index)
     upper_bound = problem.upper_bounds
     lower_bound = problem.lower_bounds
@@ -865,11 +821,9 @@ def _1d_plot(index, ax):
     interval = 0.0001
     x0 = np.arange(-1, 1 + interval, interval)
     norm_policy = np.clip(one_d_change_dim(x0), -1, 1)
-    f = np.zeros(x0.shape)
     policy = 0.5 * (norm_policy + 1) * (upper_bound - lower_bound) + lower_bound
 
-    for k in range(x0.shape[0]):
-        f[k] = problem(policy[k])
+    f = evaluate_points(problem, policy)
 
     min_val = f.min()
     f -= min_val - 1e-3
@@ -966,7 +920,7 @@ def get_csv_from_run(optimizer, disp_name, dim):
             index = int(dir)
             id = '{}_bbob_f{:03d}_i{}_d{:02}'.format(prefix, f_num[index // 15], i_num[index % 15], max(dim_c, 2))
             path = os.path.join(res_dir, dir)
-            pi_best = np.load(os.path.join(path, 'best_list_with_explore.npy'), allow_pickle=True)
+            pi_best = load_best_list(path)
         except:
             continue
         number_of_evaluations = len(pi_best)
@@ -1269,7 +1223,7 @@ def coco_visualization():
     for i, problem_index in tqdm(enumerate([7, 192, 223, 253])):
         ax = plt.subplot(3, 4, i+1)
 
-        suite = cocoex.Suite("bbob", "", ("dimensions: 2"))
+        suite = make_suite(2)
         problem = suite.get_problem(problem_index)
         upper_bound = problem.upper_bounds
         lower_bound = problem.lower_bounds
@@ -1278,12 +1232,7 @@ def coco_visualization():
         x0 = np.arange(lower_bound[0], upper_bound[0] + interval, interval)
         x1 = np.arange(lower_bound[1], upper_bound[1] + interval, interval)
         x0, x1 = np.meshgrid(x0, x1)
-        z = np.zeros(x0.shape)
-
-        for k in range(x0.shape[0]):
-            for j in range(x1.shape[1]):
-                x = np.array([x0[k, j], x1[k, j]])
-                z[k, j] = problem(x)
+        z = evaluate_points(problem, np.stack([x0.ravel(), x1.ravel()], axis=1)).reshape(x0.shape)
 
         min_val = z.min()
         z -= min_val - 1e-3
@@ -1296,17 +1245,9 @@ def coco_visualization():
         ax.set_xlabel('({}1)'.format('abcd'[i]), fontsize=16)
         ax.axis('equal')
 
-        f_list = []
-        x_list = []
-        for x0 in np.arange(lower_bound[0], upper_bound[0] + interval, interval):
-            for x1 in np.arange(lower_bound[1], upper_bound[1] + interval, interval):
-                x = np.array([x0, x1])
-                fx = problem(x)
-                f_list.append(fx)
-                x_list.append(x)
-
-        f_list = np.array(f_list)
-        x_list = np.array(x_list)
+        x0, x1 = np.meshgrid(np.arange(lower_bound[0], upper_bound[0] + interval, interval), np.arange(lower_bound[1], upper_bound[1] + interval, interval), indexing='ij')
+        x_list = np.stack([x0.ravel(), x1.ravel()], axis=1)
+        f_list = evaluate_points(problem, x_list)
 
         ax = plt.subplot(3, 4, 5+i, projection='3d')
 
@@ -1320,11 +1261,9 @@ def coco_visualization():
         interval = 0.0001
         x0 = np.arange(-1, 1 + interval, interval)
         norm_policy = np.clip(one_d_change_dim(x0), -1, 1)
-        f = np.zeros(x0.shape)
         policy = 0.5 * (norm_policy + 1) * (upper_bound - lower_bound) + lower_bound
 
-        for k in range(x0.shape[0]):
-            f[k] = problem(policy[k])
+        f = evaluate_points(problem, policy)
 
         ax = plt.subplot(3, 4, 9+i)
 